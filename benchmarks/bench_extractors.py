@@ -0,0 +1,69 @@
+'''
+Parity and speed of the two page extractor engines in scraper.py. Every page
+of the corpus must give the same text and the same set of hrefs with both
+engines; then pages/s and peak traced memory are reported for each. Run
+from the project root:
+
+    python -m benchmarks.bench_extractors --corpus path/to/pages
+'''
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from benchmarks.corpus import load_corpus
+from scraper import extract_text_and_links
+from utils.fast_extract import extract_text_and_links as fast_extract_text_and_links
+
+
+engines = {
+    "bs4": extract_text_and_links,
+    "lxml": fast_extract_text_and_links,
+}
+
+
+def check_parity(pages):
+    mismatches = 0
+    for i, content in enumerate(pages):
+        text, hrefs = extract_text_and_links(content)
+        fast_text, fast_hrefs = fast_extract_text_and_links(content)
+        if text != fast_text or set(hrefs) != set(fast_hrefs):
+            mismatches += 1
+            print(f"Page {i} differs between engines", file=sys.stderr)
+    return mismatches
+
+
+def measure(extract, pages):
+    start = time.perf_counter()
+    for content in pages:
+        extract(content)
+    rate = len(pages) / (time.perf_counter() - start)
+
+    # Peak memory is traced in a separate pass, tracing slows the parsers down
+    peak = 0
+    for content in pages:
+        tracemalloc.start()
+        extract(content)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return rate, peak
+
+
+def main(corpus, count):
+    pages = load_corpus(corpus, count)
+    mismatches = check_parity(pages)
+    print(f"Parity: {len(pages) - mismatches}/{len(pages)} pages identical")
+
+    print(f"{'engine':>8} {'pages/s':>10} {'peak KiB':>10}")
+    for name, extract in engines.items():
+        rate, peak = measure(extract, pages)
+        print(f"{name:>8} {rate:10.1f} {peak / 1024:10.1f}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None, help="Directory of saved *.html pages")
+    parser.add_argument("--count", type=int, default=200, help="Synthetic pages when no corpus is given")
+    args = parser.parse_args()
+    sys.exit(1 if main(args.corpus, args.count) else 0)
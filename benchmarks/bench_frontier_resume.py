@@ -0,0 +1,90 @@
+'''
+Startup time of Frontier on a large save file, resuming without --restart.
+The legacy loader reads every saved url and runs is_valid on the incomplete
+ones; the current one reads only the pending urls through the save file's
+pending index. Run from the project root:
+
+    python -m benchmarks.bench_frontier_resume
+'''
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+from benchmarks.corpus import letters
+import scraper
+from crawler.database import Database as db
+from crawler.frontier import Frontier
+from crawler.frontier_store import SqliteStore, to_signed
+from crawler.seen_set import make_seen_set
+from utils import get_urlhash
+
+
+class LegacyFrontier(Frontier):
+    def _parse_save_file(self):
+        total_count = len(self.save)
+        tbd_count = 0
+        for url, completed in self.save.values():
+            if not completed and scraper.is_valid(url):
+                self._enqueue(url)
+                tbd_count += 1
+        self.logger.info(
+            f"Found {tbd_count} urls to be downloaded from {total_count} "
+            f"total urls discovered.")
+
+
+def write_save_file(path, count, pending_ratio):
+    hosts = ["www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu"]
+    pending_every = max(1, round(1 / pending_ratio)) if pending_ratio > 0 else 0
+    store = SqliteStore(path)
+    rows = list()
+    for i in range(count):
+        url = f"https://{hosts[i % len(hosts)]}/people/{letters(i % 997)}/page/{letters(i)}"
+        completed = not (pending_every and i % pending_every == 0)
+        rows.append((to_signed(get_urlhash(url)), url, int(completed)))
+    with store.connection:
+        store.connection.executemany("INSERT INTO urls (urlhash, url, completed) VALUES (?, ?, ?)", rows)
+    store.close()
+
+
+def reset_database():
+    db.invalid_urls = make_seen_set()
+    db.visited_urls = make_seen_set()
+    db.unique_urls = make_seen_set()
+    db.subdomains = dict()
+
+
+def run(frontier_factory, config):
+    reset_database()
+    start = time.perf_counter()
+    frontier = frontier_factory(config, False)
+    elapsed = time.perf_counter() - start
+    queued = sum(len(urls) for urls in frontier.to_be_downloaded.values())
+    frontier.save.close()
+    return elapsed, queued, sum(db.subdomains.values())
+
+
+def main(count, pending_ratio):
+    with tempfile.TemporaryDirectory() as directory:
+        config = SimpleNamespace(
+            save_file=os.path.join(directory, "frontier.db"), save_backend="sqlite",
+            save_batch_size=500, save_flush_interval=0.5, seed_urls=[], time_delay=0.5,
+            rate_floor=0.5, rate_ceiling=30, rate_backoff=2, rate_speedup=0.9, rate_latency_factor=1,
+            host_budget=0, subdomain_budget=0)
+        start = time.perf_counter()
+        write_save_file(config.save_file, count, pending_ratio)
+        print(f"Wrote {count} urls in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'loader':>8} {'seconds':>8} {'queued':>8} {'subdomain hits':>15}")
+        for name, factory in (("legacy", LegacyFrontier), ("pending", Frontier)):
+            elapsed, queued, subdomain_hits = run(factory, config)
+            print(f"{name:>8} {elapsed:8.2f} {queued:>8} {subdomain_hits:>15}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--pending_ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    main(args.count, args.pending_ratio)
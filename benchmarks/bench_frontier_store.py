@@ -0,0 +1,48 @@
+'''
+Insert throughput of the frontier save file backends. Each url is added and
+later marked complete, the same two writes Frontier makes per url. Run from
+the project root:
+
+    python -m benchmarks.bench_frontier_store
+'''
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from crawler.frontier_store import ShelveStore, SqliteStore
+from utils import get_urlhash
+
+
+def run(store, urls):
+    start = time.perf_counter()
+    for url in urls:
+        urlhash = get_urlhash(url)
+        if urlhash not in store:
+            store[urlhash] = (url, False)
+    for url in urls:
+        store[get_urlhash(url)] = (url, True)
+    store.close()
+    return time.perf_counter() - start
+
+
+def main(count, batch_size, flush_interval):
+    urls = [f"https://www.ics.uci.edu/page/{i}" for i in range(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {
+            "shelve": lambda: ShelveStore(os.path.join(directory, "frontier.shelve")),
+            "sqlite": lambda: SqliteStore(os.path.join(directory, "frontier.db"), batch_size, flush_interval),
+        }
+        print(f"{'backend':>8} {'urls':>8} {'seconds':>8} {'inserts/s':>10}")
+        for name, factory in backends.items():
+            elapsed = run(factory(), urls)
+            print(f"{name:>8} {count:>8} {elapsed:8.2f} {2 * count / elapsed:10.0f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--count", type=int, default=2_000)
+    parser.add_argument("--batch_size", type=int, default=500)
+    parser.add_argument("--flush_interval", type=float, default=0.5)
+    args = parser.parse_args()
+    main(args.count, args.batch_size, args.flush_interval)
@@ -0,0 +1,92 @@
+'''
+Per-url cost of scraper.filter_urls against the original chain of checks in
+is_valid, on a synthetic mix of outlinks. The two accept different urls
+since dates and "filter" are left to the trap detector, so the accepted
+counts are shown as well. Run from the project root:
+
+    python -m benchmarks.bench_is_valid
+'''
+import random
+import re
+import time
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+from crawler.database import Database as db
+from crawler.seen_set import make_seen_set
+from utils.trap_detector import TrapDetector
+import scraper
+
+
+legacy_ext_re = re.compile(r".*\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|mid|mp2|mp3|mp4|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1|thmx|mso|arff|rtf|jar|csv|rm|smil|wmv|swf|wma|zip|rar|gz)$", re.IGNORECASE)
+legacy_traps = {"?share=", "pdf", "redirect", "#comment", "#comments", "#respond"}
+legacy_date_in_path_re = re.compile(r"(\d{4})(?:[/-](\d{1,2})(?:[/-](\d{1,2}))?)?")
+legacy_date_in_query_re = re.compile(r"(\d{4})((?:-\d{1,2})?)((?:-\d{1,2})?)?")
+
+
+def legacy_is_valid(url):
+    # The is_valid checks before the rules were compiled, without the
+    # subdomain bookkeeping that both versions share.
+    parsed = urlparse(url)
+    if (parsed.scheme not in {"http", "https"} or
+        not any(parsed.netloc == domain or parsed.netloc.endswith("." + domain) for domain in scraper.allowed_domains) and
+        not (parsed.netloc == scraper.specific_domain or parsed.path.startswith(scraper.specific_path)) or
+        url in db.invalid_urls or
+        url in db.visited_urls or
+        any(trap in url for trap in legacy_traps) or
+        legacy_ext_re.match(parsed.path.lower()) or
+        "filter" in url or
+        legacy_date_in_path_re.search(parsed.path) or
+        legacy_date_in_query_re.search(parsed.query)):
+        db.invalid_urls.add(url)
+        return False
+    db.unique_urls.add(url)
+    return True
+
+
+def synthetic_links(count, rng):
+    hosts = ["www.ics.uci.edu", "vision.ics.uci.edu", "www.stat.uci.edu", "www.informatics.uci.edu",
+             "www.google.com", "today.uci.edu", "www.cs.uci.edu"]
+    paths = ["/about", "/people/faculty", "/files/slides.pdf", "/images/logo.png", "/events/2021-05-03",
+             "/research/projects", "/~user/index.html", "/news?share=twitter", "/courses?filter=fall"]
+    # Pages repeat the same navigation links, so draw from a limited pool
+    pool = [f"https://{rng.choice(hosts)}{rng.choice(paths)}/{rng.randint(0, 400)}" for _ in range(count // 4)]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def reset_database():
+    db.invalid_urls = make_seen_set()
+    db.visited_urls = make_seen_set()
+    db.unique_urls = make_seen_set()
+    db.subdomains = dict()
+    scraper.trap_detector = TrapDetector(
+        scraper.trap_template_cap, scraper.trap_max_depth, scraper.trap_max_repeats)
+
+
+def main(pages, links_per_page, seed):
+    rng = random.Random(seed)
+    batches = [synthetic_links(links_per_page, rng) for _ in range(pages)]
+    total = pages * links_per_page
+
+    reset_database()
+    start = time.perf_counter()
+    legacy_valid = [[url for url in batch if legacy_is_valid(url)] for batch in batches]
+    legacy_time = time.perf_counter() - start
+
+    reset_database()
+    start = time.perf_counter()
+    valid = [scraper.filter_urls(batch) for batch in batches]
+    compiled_time = time.perf_counter() - start
+
+    print(f"{'version':>10} {'us/link':>8} {'accepted':>9}")
+    print(f"{'legacy':>10} {legacy_time / total * 1e6:8.2f} {len(set().union(*legacy_valid)):>9}")
+    print(f"{'current':>10} {compiled_time / total * 1e6:8.2f} {len(set().union(*valid)):>9}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--links_per_page", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.pages, args.links_per_page, args.seed)
@@ -0,0 +1,90 @@
+'''
+Logging cost per page of the workers' "Downloaded ..." line. Several
+threads log one line per simulated page, with logging off, with the
+legacy handlers (a FileHandler and a StreamHandler written by the calling
+thread), and through the queued logger, unsampled and sampled. The
+console goes to /dev/null. "drain" is the time the log thread still needs
+after the workers finish. Run from the project root:
+
+    python -m benchmarks.bench_logging
+'''
+import logging
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from threading import Thread
+from types import SimpleNamespace
+
+from utils import logs
+
+
+def legacy_logger(name, directory):
+    # utils.get_logger before the queued logger
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter(logs.log_format)
+    for handler in (logging.FileHandler(os.path.join(directory, "Legacy.log")), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+def queued_logger(name, directory, sample_rate):
+    logs.log_dir = directory
+    logs.configure_logging(SimpleNamespace(
+        log_sample_rate=sample_rate, log_rate_limit=0, log_batch_size=100, log_flush_interval=1.0))
+    return logs.get_logger(name, "Worker", sampled=True)
+
+
+def work(logger, pages, cache_server):
+    for i in range(pages):
+        url = f"https://www.ics.uci.edu/page/{i}"
+        if logger is None:
+            continue
+        if logger.name.startswith("legacy"):
+            logger.info(f"Downloaded {url}, status <200>, using cache {cache_server}.")
+        else:
+            logger.info("Downloaded %s, status <%s>, using cache %s.", url, 200, cache_server)
+
+
+def run(logger, threads, pages):
+    workers = [Thread(target=work, args=(logger, pages, ("127.0.0.1", 9000))) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    logs.stop_logging()
+    return elapsed, time.perf_counter() - start
+
+
+def main(threads, pages, sample_rate):
+    # Handlers made from here on write the console to /dev/null
+    sys.stderr = open(os.devnull, "w")
+    total = threads * pages
+    print(f"{threads} threads, {pages} pages each", file=sys.stdout)
+    print(f"{'mode':>16} {'us/page':>8} {'drain ms':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        modes = [
+            ("off", lambda: None),
+            ("legacy", lambda: legacy_logger("legacy", directory)),
+            ("queued", lambda: queued_logger("queued", directory, 1.0)),
+            (f"queued {sample_rate:g}", lambda: queued_logger("sampled", directory, sample_rate)),
+        ]
+        for mode, make_logger in modes:
+            elapsed, drain = run(make_logger(), threads, pages)
+            print(f"{mode:>16} {1e6 * elapsed / total:8.2f} {1000 * drain:9.1f}")
+        logging.getLogger("legacy").handlers.clear()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=20_000)
+    parser.add_argument("--sample_rate", type=float, default=0.1)
+    args = parser.parse_args()
+    main(args.threads, args.pages, args.sample_rate)
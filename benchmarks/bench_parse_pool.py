@@ -0,0 +1,45 @@
+'''
+Parse throughput of the process-pool parse stage against parsing in the
+calling thread, over a corpus of saved pages. Run from the project root:
+
+    python -m benchmarks.bench_parse_pool --corpus path/to/pages
+'''
+import os
+import time
+from argparse import ArgumentParser
+
+from benchmarks.corpus import load_corpus
+from crawler.parse_pool import ParsePool
+from scraper import parse_page
+
+
+def main(corpus, count, max_processes):
+    pages = load_corpus(corpus, count)
+
+    start = time.perf_counter()
+    for content in pages:
+        parse_page(content)
+    baseline = len(pages) / (time.perf_counter() - start)
+    print(f"{'processes':>10} {'pages/s':>10} {'speedup':>8}")
+    print(f"{'inline':>10} {baseline:10.1f} {1:8.2f}")
+
+    processes = 1
+    while processes <= max_processes:
+        pool = ParsePool(processes)
+        # Warm up so process start-up is not timed
+        list(pool.map(pages[:processes], chunksize=1))
+        start = time.perf_counter()
+        list(pool.map(pages, chunksize=4))
+        rate = len(pages) / (time.perf_counter() - start)
+        pool.close()
+        print(f"{processes:>10} {rate:10.1f} {rate / baseline:8.2f}")
+        processes *= 2
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None, help="Directory of saved *.html pages")
+    parser.add_argument("--count", type=int, default=200, help="Synthetic pages when no corpus is given")
+    parser.add_argument("--max_processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    main(args.corpus, args.count, args.max_processes)
@@ -0,0 +1,100 @@
+'''
+End-to-end crawl throughput without the cache server. A full Crawler runs
+against a ReplayServer, in its own process so its CPU time is not counted,
+serving a recorded corpus (RECORD_DIR of an earlier crawl) or a synthetic
+linked site. Reports pages/s, the crawler's CPU time and its peak RSS. Run
+from the project root, one configuration per run since peak RSS only grows:
+
+    python -m benchmarks.bench_replay --pages 2000 --latency 20
+    python -m benchmarks.bench_replay --corpus path/to/recorded --seeds https://www.ics.uci.edu
+'''
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from benchmarks.corpus import write_synthetic_site
+from crawler import Crawler
+from crawler.database import Database as db
+from utils.config import Config
+from utils.replay import ResponseCorpus, ReplayServer
+
+
+def serve(directory, latency, jitter, addresses, stopped):
+    server = ReplayServer(ResponseCorpus(directory), latency, jitter)
+    addresses.put(server.start())
+    stopped.wait()
+    server.stop()
+
+
+def main(args):
+    directory = tempfile.mkdtemp()
+    corpus_dir = args.corpus
+    seeds = args.seeds.split(",") if args.seeds else None
+    if not corpus_dir:
+        corpus_dir = os.path.join(directory, "corpus")
+        start = time.perf_counter()
+        seeds = write_synthetic_site(ResponseCorpus(corpus_dir), args.pages, args.links)
+        print(f"Wrote a synthetic site of {args.pages} pages in {time.perf_counter() - start:.1f}s")
+
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    config.seed_urls = seeds or config.seed_urls
+    config.save_file = os.path.join(directory, "frontier.db")
+    # The adaptive delay never goes below the floor, so it follows --politeness too
+    config.time_delay = args.politeness
+    config.rate_floor = args.politeness
+    config.threads_count = args.threads
+    config.concurrency = args.threads
+    config.parse_processes = args.parse_processes
+    config.record_dir = ""
+
+    context = multiprocessing.get_context("spawn")
+    addresses = context.Queue()
+    stopped = context.Event()
+    server = context.Process(
+        target=serve, args=(corpus_dir, args.latency / 1000, args.jitter / 1000, addresses, stopped))
+    server.start()
+    config.cache_server = addresses.get()
+
+    db.configure(config)
+    if args.engine == "async":
+        from crawler.async_worker import AsyncCrawler
+        crawler = AsyncCrawler(config, True)
+    else:
+        crawler = Crawler(config, True)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    crawler.start()
+    elapsed = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    stopped.set()
+    server.join()
+
+    cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    # ru_maxrss is in kilobytes on Linux
+    print(f"{'engine':>8} {'workers':>8} {'pages':>7} {'seconds':>8} {'pages/s':>8} {'cpu s':>7} {'peak MB':>8}")
+    print(f"{args.engine:>8} {args.threads:>8} {len(db.visited_urls):>7} {elapsed:8.2f} "
+          f"{len(db.visited_urls) / elapsed:8.1f} {cpu:7.2f} {usage.ru_maxrss / 1024:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None, help="recorded corpus, synthetic site if omitted")
+    parser.add_argument("--seeds", type=str, default=None, help="comma separated, defaults to SEEDURL")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--links", type=int, default=20)
+    parser.add_argument("--engine", type=str, default="threaded", choices=("threaded", "async"))
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--parse_processes", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds per request")
+    parser.add_argument("--jitter", type=float, default=0, help="milliseconds of random extra latency")
+    parser.add_argument("--politeness", type=float, default=0.0, help="seconds between requests to one host")
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+'''
+Cost of writing the reports mid-crawl. A report is written from a
+snapshot of the Database: the workers only wait while the snapshot is
+copied, the top tokens and the files are computed afterwards. Prints the
+time the Database locks are held, the time to write the reports, and the
+longest a thread adding urls had to wait meanwhile. Run from the project
+root:
+
+    python -m benchmarks.bench_report
+'''
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from threading import Thread, Event
+
+from benchmarks.corpus import letters
+from crawler.database import Database as db
+from crawler.seen_set import make_seen_set
+from crawler.token_stats import TokenStats
+
+
+def fill_database(urls, tokens, seed):
+    rng = random.Random(seed)
+    db.unique_urls = make_seen_set()
+    db.subdomains = dict()
+    db.tokens = TokenStats()
+    for i in range(urls):
+        host = f"{letters(i % 50)}.ics.uci.edu"
+        db.unique_urls.add(f"https://{host}/{letters(i)}")
+        db.subdomains[host] = db.subdomains.get(host, 0) + 1
+    db.longest_page = [f"https://www.ics.uci.edu/{letters(0)}", 1000]
+    vocabulary = [f"token{letters(i)}" for i in range(tokens)]
+    db.tokens.update(Counter({token: rng.randint(1, 10_000) for token in vocabulary}))
+
+
+def add_urls(stopped, stalls):
+    # Stands in for the workers' is_valid, which adds under Database.lock
+    i = 0
+    while not stopped.is_set():
+        start = time.perf_counter()
+        with db.lock:
+            db.unique_urls.add(f"https://new.ics.uci.edu/{letters(i)}")
+        stalls.append(time.perf_counter() - start)
+        i += 1
+        time.sleep(0.0001)
+
+
+def main(urls, tokens, rounds, seed):
+    fill_database(urls, tokens, seed)
+    stopped = Event()
+    stalls = list()
+    adder = Thread(target=add_urls, args=(stopped, stalls), daemon=True)
+    adder.start()
+    snapshot_times, write_times = list(), list()
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            snapshot = db.report_snapshot()
+            snapshot_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            db.write_reports(snapshot, directory)
+            write_times.append(time.perf_counter() - start)
+    stopped.set()
+    adder.join()
+
+    print(f"{urls} unique urls, {tokens} distinct tokens, {rounds} reports")
+    print(f"snapshot (locks held): {1000 * min(snapshot_times):8.1f} ms")
+    print(f"write (no lock):       {1000 * min(write_times):8.1f} ms")
+    print(f"longest adder wait:    {1000 * max(stalls):8.1f} ms over {len(stalls)} adds")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=500_000)
+    parser.add_argument("--tokens", type=int, default=500_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.urls, args.tokens, args.rounds, args.seed)
@@ -0,0 +1,70 @@
+'''
+Decode cost per page of a cache server payload: the legacy Response, which
+unpickles a full requests.Response for every page, against the lazy
+Response with the restricted unpickler. Pages with a non-200 status are
+never unpickled by the lazy one. Run from the project root:
+
+    python -m benchmarks.bench_response
+'''
+import pickle
+import time
+from argparse import ArgumentParser
+
+import cbor
+
+from benchmarks.corpus import cache_payload, load_corpus
+from utils.response import Response
+
+
+class LegacyResponse(object):
+    def __init__(self, resp_dict):
+        self.url = resp_dict["url"]
+        self.status = resp_dict["status"]
+        self.error = resp_dict["error"] if "error" in resp_dict else None
+        try:
+            self.raw_response = (
+                pickle.loads(resp_dict["response"])
+                if "response" in resp_dict else
+                None)
+        except TypeError:
+            self.raw_response = None
+
+
+def legacy_decode(body):
+    resp = LegacyResponse(cbor.loads(body))
+    return resp.raw_response.content if resp.status == 200 else None
+
+
+def lazy_decode(body):
+    resp = Response(cbor.loads(body))
+    return resp.content if resp.status == 200 else None
+
+
+def measure(decode, payloads, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in payloads:
+            decode(body)
+    return (time.perf_counter() - start) / (repeat * len(payloads))
+
+
+def main(count, repeat):
+    pages = load_corpus(count=count)
+    ok = [cache_payload(f"https://www.ics.uci.edu/page/{i}", page) for i, page in enumerate(pages)]
+    missing = [cache_payload(f"https://www.ics.uci.edu/gone/{i}", b"", status=404) for i in range(count)]
+    for body in ok:
+        assert legacy_decode(body) == lazy_decode(body)
+
+    print(f"{'payload':>8} {'legacy us':>10} {'lazy us':>10} {'speedup':>8}")
+    for name, payloads in (("200", ok), ("404", missing)):
+        legacy = measure(legacy_decode, payloads, repeat)
+        lazy = measure(lazy_decode, payloads, repeat)
+        print(f"{name:>8} {legacy * 1e6:10.1f} {lazy * 1e6:10.1f} {legacy / lazy:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.count, args.repeat)
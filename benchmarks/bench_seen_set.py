@@ -0,0 +1,48 @@
+'''
+Memory per url and lookup throughput of the Database seen set modes. Run
+from the project root:
+
+    python -m benchmarks.bench_seen_set
+'''
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from crawler.seen_set import make_seen_set
+
+
+def main(count, lookups, error_rate):
+    urls = [f"https://www.ics.uci.edu/~user{i % 997}/page/{i}.html" for i in range(count)]
+    unseen = [f"https://www.stat.uci.edu/unseen/{i}" for i in range(lookups)]
+
+    print(f"{'mode':>12} {'bytes/url':>10} {'lookups/s':>10} {'false pos':>10}")
+    for mode in ("exact", "fingerprint", "bloom"):
+        # The url strings are allocated before tracing starts; they are only
+        # counted for the mode that keeps them alive.
+        tracemalloc.start()
+        seen = make_seen_set(mode, error_rate)
+        for url in urls:
+            seen.add(url)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if seen.retains_urls:
+            memory += sum(sys.getsizeof(url) for url in urls)
+
+        queries = urls[:lookups // 2] + unseen[:lookups // 2]
+        start = time.perf_counter()
+        for url in queries:
+            url in seen
+        elapsed = time.perf_counter() - start
+
+        false_positives = sum(1 for url in unseen if url in seen) / len(unseen)
+        print(f"{mode:>12} {memory / count:10.1f} {len(queries) / elapsed:10.0f} {false_positives:10.5f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--count", type=int, default=300_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--error_rate", type=float, default=0.001)
+    args = parser.parse_args()
+    main(args.count, args.lookups, args.error_rate)
@@ -0,0 +1,86 @@
+'''
+Lookup latency, candidates compared per lookup and bytes per stored
+fingerprint of the near-duplicate index as it grows, with the default
+blocks and with blocks chosen for the largest size. With fixed blocks the
+candidates grow linearly with the index; more tables cost 9 to 10 bytes per
+fingerprint each. Run from the project root:
+
+    python -m benchmarks.bench_simhash_index
+'''
+import random
+import time
+from argparse import ArgumentParser
+
+from crawler.simhash_index import LinearSimhashIndex, PermutedSimhashIndex
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def time_lookups(index, queries):
+    start = time.perf_counter()
+    hits = sum(1 for query in queries if index.has_near(query))
+    return (time.perf_counter() - start) / len(queries), hits
+
+
+def candidates_per_lookup(index, queries):
+    lookups, candidates = index.lookups, index.candidates
+    time_lookups(index, queries)
+    return (index.candidates - candidates) / (index.lookups - lookups)
+
+
+def main(sizes, queries_count, distance, seed):
+    rng = random.Random(seed)
+    index = PermutedSimhashIndex(max_distance=distance)
+    sized = PermutedSimhashIndex(max_distance=distance, expected_size=max(sizes))
+    linear = LinearSimhashIndex(max_distance=distance)
+    stored = list()
+
+    print(f"{index.blocks} blocks, {len(index.tables)} tables; "
+          f"sized for {max(sizes)}: {sized.blocks} blocks, {len(sized.tables)} tables")
+    print(f"{'stored':>10} {'index us/lookup':>16} {'candidates':>11} {'B/fp':>6} {'sized us/lookup':>16} "
+          f"{'candidates':>11} {'B/fp':>6} {'us/add':>7} {'linear us/lookup':>17} {'near hits':>10}")
+    for size in sorted(sizes):
+        added = size - len(stored)
+        add_time = 0.0
+        while len(stored) < size:
+            value = rng.getrandbits(64)
+            stored.append(value)
+            index.add(value)
+            start = time.perf_counter()
+            sized.add(value)
+            add_time += time.perf_counter() - start
+            if size <= 100_000:
+                linear.add(value)
+
+        # Half the queries are random misses, half are near-duplicates of stored values
+        queries = [rng.getrandbits(64) for _ in range(queries_count // 2)]
+        queries += [flip_bits(rng.choice(stored), rng.randint(0, distance), rng) for _ in range(queries_count // 2)]
+        rng.shuffle(queries)
+
+        index_time, index_hits = time_lookups(index, queries)
+        sized_time, _ = time_lookups(sized, queries)
+        # Misses only, a hit stops at the first near candidate
+        misses = [rng.getrandbits(64) for _ in range(queries_count // 2)]
+        index_candidates, sized_candidates = candidates_per_lookup(index, misses), candidates_per_lookup(sized, misses)
+        if size <= 100_000:
+            linear_time, _ = time_lookups(linear, queries[:max(1, queries_count // 10)])
+            linear_column = f"{linear_time * 1e6:17.1f}"
+        else:
+            linear_column = f"{'skipped':>17}"
+        print(f"{size:>10} {index_time * 1e6:16.1f} {index_candidates:11.2f} {index.memory_bytes() / size:6.0f} "
+              f"{sized_time * 1e6:16.1f} {sized_candidates:11.2f} {sized.memory_bytes() / size:6.0f} "
+              f"{add_time / max(1, added) * 1e6:7.1f} {linear_column} {index_hits:>10}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--distance", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.sizes, args.queries, args.distance, args.seed)
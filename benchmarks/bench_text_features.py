@@ -0,0 +1,120 @@
+'''
+Speed and near-duplicate agreement of the two text features engines in
+scraper.py: Simhash(text) plus a separate tokenize pass, against
+crawler.text_features, one page at a time and in batches. Page text is
+extracted once up front, so only the features are timed. For agreement,
+every page is compared with a copy that has a fraction of its words
+replaced, which both engines should call a near-duplicate, and every pair
+of distinct pages is compared for the false positive rate. Without
+--corpus the pages are generated from a Zipf distributed vocabulary with
+a topic per page, so that distinct pages do not share most of their
+words. Run from the project root:
+
+    python -m benchmarks.bench_text_features --corpus path/to/pages
+'''
+import random
+import time
+from argparse import ArgumentParser
+from itertools import accumulate, combinations
+
+from simhash import Simhash
+
+from benchmarks.corpus import load_corpus, letters
+import scraper
+from crawler.text_features import text_features
+from crawler.token_stats import count_tokens
+
+
+def vocabulary_pages(count, vocabulary_size=20000, topic_size=400, paragraphs=40):
+    # Pages whose words follow Zipf's law over a shared vocabulary, half of
+    # them drawn from a topic of the page's own
+    vocabulary = [letters(i) for i in range(vocabulary_size)]
+    cum_weights = list(accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+    pages = list()
+    for seed in range(count):
+        rng = random.Random(seed)
+        topic = rng.sample(vocabulary, topic_size)
+        body = list()
+        for _ in range(paragraphs):
+            length = rng.randint(20, 80)
+            paragraph = rng.choices(vocabulary, cum_weights=cum_weights, k=length // 2)
+            paragraph += rng.choices(topic, k=length - length // 2)
+            rng.shuffle(paragraph)
+            body.append(f"<p>{' '.join(paragraph)}.</p>\n")
+        body = "".join(body)
+        pages.append(f"<html><head><title>Page {seed}</title></head><body>{body}</body></html>".encode("utf-8"))
+    return pages
+
+
+def legacy_features(texts):
+    features = list()
+    for text in texts:
+        counts, total = count_tokens(text)
+        features.append((counts, total, Simhash(text).value))
+    return features
+
+
+def numpy_features(texts):
+    return [text_features([text])[0] for text in texts]
+
+
+def batched(batch_size):
+    def features(texts):
+        results = list()
+        for start in range(0, len(texts), batch_size):
+            results.extend(text_features(texts[start:start + batch_size]))
+        return results
+    return features
+
+
+def perturb(text, fraction, rng):
+    words = text.split(" ")
+    for i in rng.sample(range(len(words)), int(len(words) * fraction)):
+        words[i] = rng.choice(words)
+    return " ".join(words)
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def main(corpus, count, batch_size, fraction, threshold, seed):
+    pages = load_corpus(corpus) if corpus else vocabulary_pages(count)
+    texts = [page[0] for page in map(scraper.extract_page, pages) if page]
+    print(f"{len(texts)} pages, {sum(map(len, texts)) / len(texts) / 1024:.1f} KiB of text each")
+
+    engines = {
+        "simhash": legacy_features,
+        "numpy": numpy_features,
+        f"numpy x{batch_size}": batched(batch_size),
+    }
+    print(f"{'engine':>12} {'pages/s':>10}")
+    for name, features in engines.items():
+        start = time.perf_counter()
+        features(texts)
+        print(f"{name:>12} {len(texts) / (time.perf_counter() - start):10.1f}")
+
+    rng = random.Random(seed)
+    copies = [perturb(text, fraction, rng) for text in texts]
+    print(f"\nWithin {threshold} bits, {fraction:.0%} of the words replaced:")
+    print(f"{'engine':>12} {'copies':>8} {'false positives':>16}")
+    pairs = len(texts) * (len(texts) - 1) // 2
+    for name, features in (("simhash", legacy_features), ("numpy", batched(batch_size))):
+        hashes = [fingerprint for _, _, fingerprint in features(texts)]
+        copy_hashes = [fingerprint for _, _, fingerprint in features(copies)]
+        copies_found = sum(distance(a, b) <= threshold for a, b in zip(hashes, copy_hashes))
+        # Pairs of distinct pages within the threshold
+        false_positives = sum(distance(a, b) <= threshold for a, b in combinations(hashes, 2))
+        print(f"{name:>12} {copies_found / len(texts):8.1%} {false_positives / pairs:16.3%}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str, default=None, help="directory of saved *.html pages")
+    parser.add_argument("--count", type=int, default=200, help="generated pages without --corpus")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--fraction", type=float, default=0.02)
+    parser.add_argument("--threshold", type=int, default=scraper.simhash_threshold)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.corpus, args.count, args.batch_size, args.fraction, args.threshold, args.seed)
@@ -0,0 +1,91 @@
+'''
+Synthetic crawler traps against the trap detector: a calendar, session ids
+in the query and in the path, repeating and very deep paths, next to
+ordinary pages that must all pass. Prints how many urls of each scenario
+are accepted and the cost per url, and exits with status 1 if a trap gets
+more than the template cap through or an ordinary page is rejected. Run
+from the project root:
+
+    python -m benchmarks.bench_trap_detector
+'''
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from urllib.parse import urlparse
+
+from benchmarks.corpus import letters, words
+from utils.trap_detector import TrapDetector
+
+
+def calendar(count):
+    start = date(2015, 1, 1)
+    days = [start + timedelta(days=i) for i in range(count)]
+    return ([f"https://www.ics.uci.edu/events/{day.isoformat()}/" for day in days] +
+            [f"https://www.ics.uci.edu/calendar/?year={day.year}&month={day.month}&day={day.day}" for day in days])
+
+
+def query_session_ids(count, rng):
+    return [f"https://www.stat.uci.edu/seminars?sid={rng.getrandbits(128):032x}&lang=en" for _ in range(count)]
+
+
+def path_session_ids(count, rng):
+    return [f"https://www.cs.uci.edu/app/{rng.getrandbits(128):032x}/view" for _ in range(count)]
+
+
+def repeating_paths(count):
+    return [f"https://www.informatics.uci.edu/{'a/b/' * (i % 5 + 3)}{letters(i)}" for i in range(count)]
+
+
+def deep_paths(count):
+    return [f"https://vision.ics.uci.edu/{'/'.join(letters(i + depth) for depth in range(12))}" for i in range(count)]
+
+
+def ordinary_pages(count, rng):
+    hosts = ["www.ics.uci.edu", "www.cs.uci.edu", "www.stat.uci.edu", "www.informatics.uci.edu"]
+    return [f"https://{rng.choice(hosts)}/{rng.choice(words)}/{letters(i)}/index.html" for i in range(count)]
+
+
+def main(count, template_cap, seed):
+    rng = random.Random(seed)
+    scenarios = {
+        "calendar": (calendar(count), 2 * template_cap),
+        "query sid": (query_session_ids(count, rng), template_cap),
+        "path sid": (path_session_ids(count, rng), template_cap),
+        "repeat": (repeating_paths(count), 0),
+        "depth": (deep_paths(count), 0),
+    }
+    ordinary = ordinary_pages(count, rng)
+
+    detector = TrapDetector(template_cap)
+    # Interleave the scenarios the way a crawl discovers them
+    urls = [url for urls, _ in scenarios.values() for url in urls] + ordinary
+    rng.shuffle(urls)
+    parsed = [urlparse(url) for url in urls]
+    start = time.perf_counter()
+    accepted = {url for url, parts in zip(urls, parsed) if detector.rejection_reason(parts) is None}
+    elapsed = time.perf_counter() - start
+
+    failed = False
+    print(f"{'scenario':>10} {'urls':>7} {'accepted':>9} {'limit':>7}")
+    for name, (scenario_urls, limit) in scenarios.items():
+        passed = sum(1 for url in scenario_urls if url in accepted)
+        failed |= passed > limit
+        print(f"{name:>10} {len(scenario_urls):>7} {passed:>9} {limit:>7}")
+    passed = sum(1 for url in ordinary if url in accepted)
+    failed |= passed != len(ordinary)
+    print(f"{'ordinary':>10} {len(ordinary):>7} {passed:>9} {len(ordinary):>7}")
+    print(f"\n{elapsed / len(urls) * 1e6:.2f} us/url over {len(urls)} urls, {len(detector.counts)} templates")
+    if failed:
+        print("Trap detector let a trap through or rejected an ordinary page")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--template_cap", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.count, args.template_cap, args.seed)
@@ -0,0 +1,89 @@
+import os
+import pickle
+import random
+
+import cbor
+import requests
+
+
+words = [
+    "crawler", "search", "index", "token", "engine", "page", "student", "research",
+    "faculty", "course", "informatics", "statistics", "computer", "science", "graduate",
+    "seminar", "project", "lab", "data", "machine", "learning", "systems", "network",
+]
+
+
+def synthetic_page(seed, paragraphs=40, links=60):
+    rng = random.Random(seed)
+    body = "".join(
+        f"<div class='p'><p>{' '.join(rng.choice(words) for _ in range(rng.randint(20, 80)))}.</p>"
+        f"<!-- paragraph {i} --></div>\n"
+        for i in range(paragraphs))
+    anchors = "".join(
+        f'<li><a href="https://www.ics.uci.edu/{rng.choice(words)}/{rng.randint(0, 10**6)}#top">link</a></li>\n'
+        for _ in range(links))
+    return (
+        f"<html><head><title>Page {seed}</title><style>p {{ margin: 0 }}</style>"
+        f"<script>var page = {seed};</script></head>"
+        f"<body><ul>{anchors}</ul>{body}</body></html>").encode("utf-8")
+
+
+def load_corpus(directory=None, count=200):
+    # Saved pages (*.html) from a directory, or synthetic pages without one.
+    if directory:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".html"))
+        pages = list()
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append(f.read())
+        return pages
+    return [synthetic_page(seed) for seed in range(count)]
+
+
+def letters(number):
+    # Digits in a url path would look like a date to the url filter
+    digits = list()
+    while True:
+        number, digit = divmod(number, 26)
+        digits.append(chr(ord("a") + digit))
+        if not number:
+            return "".join(digits)
+
+
+site_hosts = [
+    "www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu",
+    "vision.ics.uci.edu", "sdcl.ics.uci.edu", "wics.ics.uci.edu", "isg.ics.uci.edu",
+]
+
+
+def site_url(index):
+    return f"https://{site_hosts[index % len(site_hosts)]}/{words[index % len(words)]}/{letters(index)}"
+
+
+def cache_payload(url, content, status=200):
+    # The body the cache server sends for a url: CBOR wrapping a pickled requests.Response
+    response = requests.Response()
+    response.status_code = status
+    response.url = url
+    response._content = content
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(response)})
+
+
+def write_synthetic_site(corpus, count=2000, links=20, seed=0):
+    # Linked pages spread over site_hosts, recorded into a ResponseCorpus.
+    # Most words are random letters so pages are not near-duplicates.
+    # Returns the seed urls, one per host.
+    rng = random.Random(seed)
+    for index in range(count):
+        paragraphs = "".join(
+            "<p>" + " ".join(rng.choice(words) if rng.random() < 0.2 else letters(rng.randrange(26 ** 5))
+                      for _ in range(60)) + ".</p>\n"
+            for _ in range(8))
+        anchors = "".join(
+            f'<li><a href="{site_url(rng.randrange(count))}">link</a></li>\n' for _ in range(links))
+        content = (
+            f"<html><head><title>Page {index}</title></head>"
+            f"<body><ul>{anchors}</ul>{paragraphs}</body></html>").encode("utf-8")
+        url = site_url(index)
+        corpus.record(url, 200, cache_payload(url, content))
+    return [site_url(index) for index in range(min(count, len(site_hosts)))]
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from utils import get_logger
+from utils.async_download import AsyncDownloader
+from utils.metrics import metrics
+from crawler.frontier import Frontier
+from crawler.parse_pool import get_parse
+from crawler.page_cache import get_page_cache
+import scraper
+
+
+
+class AsyncCrawler(object):
+    '''
+    Crawler that runs its workers as coroutines on one event loop. Downloads
+    share a keep-alive connection pool, so `config.concurrency` fetches can be
+    in flight at once. Scraping is CPU work and the frontier calls take its
+    lock and write its save file, so both run in the loop's default thread
+    pool. The frontier still enforces the per-host politeness, and an idle
+    coroutine waits until the frontier wakes it or its host delay passes.
+    '''
+
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        self.config = config
+        self.logger = get_logger("CRAWLER")
+        self.frontier = frontier_factory(config, restart)
+        self.parse = get_parse(config)
+        self.page_cache = get_page_cache(config)
+        self.archive = None
+        if config.archive_dir:
+            # Imported here so the archive is only loaded with ARCHIVE_DIR set
+            from crawler.page_archive import get_archive
+            self.archive = get_archive(config)
+
+    def start(self):
+        asyncio.run(self._crawl())
+
+    async def _crawl(self):
+        downloader = AsyncDownloader(self.config, get_logger("Worker-async", "Worker", sampled=True))
+        await downloader.open()
+        try:
+            await asyncio.gather(*(
+                self._work(worker_id, downloader)
+                for worker_id in range(self.config.concurrency)))
+        finally:
+            await downloader.close()
+
+    async def _work(self, worker_id, downloader):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+
+        def wake():
+            # Called by the frontier from an executor thread
+            loop.call_soon_threadsafe(ready.set)
+
+        while True:
+            # Cleared before polling, so a wake-up during the poll is kept
+            ready.clear()
+            tbd_url, wait_time = await loop.run_in_executor(
+                None, self.frontier.poll_tbd_url_or_wait, worker_id, wake)
+            if tbd_url is None:
+                if wait_time is None:
+                    self.logger.info(f"Frontier is empty. Stopping coroutine {worker_id}.")
+                    return
+                try:
+                    await asyncio.wait_for(ready.wait(), None if wait_time == float("inf") else wait_time)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            resp, elapsed = None, None
+            try:
+                start = time.perf_counter()
+                with metrics.timer("download"):
+                    headers = self.page_cache.conditional_headers(tbd_url) if self.page_cache else None
+                    resp = await downloader.download(tbd_url, headers)
+                elapsed = time.perf_counter() - start
+                metrics.inc("downloads", status=resp.status)
+                downloader.logger.info(
+                    "Downloaded %s, status <%s>, using cache %s.",
+                    tbd_url, resp.status, self.config.cache_server)
+                await loop.run_in_executor(None, self._scrape, tbd_url, resp)
+            except Exception as e:
+                metrics.inc("crawl_errors")
+                downloader.logger.error(f"Failed to crawl {tbd_url}: {e}")
+            await loop.run_in_executor(None, self.frontier.mark_url_complete, tbd_url, resp, elapsed)
+
+    def _scrape(self, url, resp):
+        for scraped_url in scraper.scraper(url, resp, self.parse, self.frontier.owns, self.page_cache):
+            self.frontier.add_url(scraped_url)
+        if self.archive is not None:
+            self.archive.add(url, resp)
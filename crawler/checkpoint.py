@@ -0,0 +1,193 @@
+import os
+import pickle
+import shutil
+import struct
+import zlib
+
+from threading import Thread, Event
+
+from crawler.database import Database as db
+from utils import get_logger
+
+
+# Each delta record is its length, its sequence number, then the payload
+record_header = struct.Struct("<IQ")
+
+
+def dump(obj):
+    return zlib.compress(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def load(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+def start_checkpointer(config, restart):
+    # Restores the Database unless restarting, then checkpoints it as it changes
+    checkpointer = Checkpointer(config)
+    if restart:
+        checkpointer.remove()
+        db.tokens.clear_spill_dir()
+    elif checkpointer.enabled:
+        # Must run before the frontier reloads its save file
+        checkpointer.load()
+    checkpointer.start()
+    return checkpointer
+
+
+class Checkpointer(object):
+    '''
+    Saves the Database incrementally so a crawl can resume without --restart.
+
+    Every `interval` seconds the changes since the last checkpoint are
+    appended to `delta.log`. Every `snapshot_every` deltas the whole
+    Database is written to `snapshot.pkl` instead and the log is cleared.
+    Deltas carry a sequence number and the snapshot records the next one,
+    so deltas already folded into the snapshot are skipped on load. A record
+    cut short by a crash is ignored along with everything after it.
+
+    A tracked frontier only writes urls as completed once the checkpoint
+    holding their pages is written, so a crash never loses the stats of a
+    url the frontier will not download again.
+    '''
+
+    def __init__(self, config):
+        self.directory = config.checkpoint_dir
+        self.interval = config.checkpoint_interval
+        self.snapshot_every = config.checkpoint_snapshot_every
+        self.snapshot_path = os.path.join(self.directory, "snapshot.pkl")
+        self.delta_path = os.path.join(self.directory, "delta.log")
+        self.logger = get_logger("CHECKPOINT")
+        self.seq = 0
+        self.deltas_since_snapshot = 0
+        self.stopped = Event()
+        self.thread = None
+        self.frontier = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def remove(self):
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+    def load(self):
+        # Restores the Database from the last checkpoint, returns False if there is none
+        if not os.path.exists(self.snapshot_path) and not os.path.exists(self.delta_path):
+            return False
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                self.seq, state = load(f.read())
+            db.restore_state(state)
+
+        replayed = 0
+        if os.path.exists(self.delta_path):
+            with open(self.delta_path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + record_header.size <= len(data):
+                length, seq = record_header.unpack_from(data, offset)
+                start = offset + record_header.size
+                if start + length > len(data):
+                    break
+                offset = start + length
+                if seq < self.seq:
+                    continue
+                db.apply_delta(load(data[start:offset]))
+                self.seq = seq + 1
+                replayed += 1
+            if offset < len(data):
+                # Cut the partial record so new deltas are appended after a whole one
+                self.logger.info(f"Ignoring truncated delta after checkpoint {self.seq}")
+                with open(self.delta_path, "r+b") as f:
+                    f.truncate(offset)
+        self.deltas_since_snapshot = replayed
+        self.logger.info(f"Loaded checkpoint {self.seq} ({replayed} deltas replayed)")
+        return True
+
+    def start(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        db.start_journal()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def track(self, frontier):
+        # Must be called before the crawl starts completing urls
+        if not self.enabled:
+            return
+        frontier.defer_completions()
+        self.frontier = frontier
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.checkpoint()
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.checkpoint()
+
+    def checkpoint(self):
+        # Taken first: the pages of these urls were merged before they were
+        # completed, so the checkpoint below holds all of them
+        completions = self.frontier.take_completions() if self.frontier else list()
+        try:
+            if self.frontier:
+                # The urls those pages found are in the frontier store before
+                # the Database state that records the pages is written
+                with self.frontier.lock:
+                    self.frontier.save.sync()
+            if self.deltas_since_snapshot >= self.snapshot_every:
+                self.write_snapshot()
+            else:
+                self.write_delta()
+        except Exception as e:
+            self.logger.error(f"Checkpoint {self.seq} failed: {e}")
+            if self.frontier:
+                self.frontier.restore_completions(completions)
+            return
+        if self.frontier:
+            self.frontier.commit_completions(completions)
+
+    def write_delta(self):
+        delta = db.drain_delta()
+        try:
+            payload = dump(delta)
+            with open(self.delta_path, "ab") as f:
+                start = f.tell()
+                try:
+                    f.write(record_header.pack(len(payload), self.seq))
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                except Exception:
+                    # Drop the partial record so the next delta follows a whole one
+                    f.truncate(start)
+                    raise
+        except Exception:
+            db.restore_delta(delta)
+            raise
+        self.seq += 1
+        self.deltas_since_snapshot += 1
+
+    def write_snapshot(self):
+        # The snapshot resets every journal, so it also covers the pending delta
+        state = db.snapshot_state()
+        self.seq += 1
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(dump((self.seq, state)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # Deltas below self.seq are skipped from here on, so the log can go
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+        self.deltas_since_snapshot = 0
+        self.logger.info(f"Wrote snapshot {self.seq}")
@@ -1,29 +1,132 @@
 import os
-import re
-from collections import Counter
+from collections import namedtuple
+from itertools import chain
+from threading import RLock
+from crawler.simhash_index import PermutedSimhashIndex
+from crawler.seen_set import make_seen_set
+from crawler.token_stats import TokenStats, count_tokens
 
 
 path_name = "data"
-min_token_length = 3
-token_pattern = re.compile(r"[a-zA-Z0-9']+")
+
+# Everything the reports are written from, copied at one point of the crawl
+ReportSnapshot = namedtuple(
+    "ReportSnapshot", ["unique_count", "unique_urls", "longest_page", "subdomains", "tokens"])
 
 
 class Database:
 
     # Save all visited urls
-    visited_urls = set()
+    visited_urls = make_seen_set()
     # Save all invalid urls
-    invalid_urls = set()
-    # Save content hash
-    content_hash = set()
+    invalid_urls = make_seen_set()
+    # Save content hash, indexed for near-duplicate lookups by Hamming distance
+    content_hash = PermutedSimhashIndex(max_distance=5)
     # Save all unique urls for problem 1
-    unique_urls = set()
+    unique_urls = make_seen_set()
     # Save longest page url and its word count for problem 2
     longest_page = ["", 0]
     # Save all tokens and their occurence for problem 3
-    tokens = dict()
+    tokens = TokenStats(spill_dir=f"{path_name}/token_spill")
     # Save all subdomains and their unique urls for problem 4
     subdomains = dict()
+    # Guards the counters above that are updated by several workers
+    lock = RLock()
+
+
+    @staticmethod
+    def configure(config):
+        # Swap the url sets for the compact mode chosen in config.ini, and
+        # the near-duplicate index for scraper.simhash_threshold and
+        # SIMHASH_INDEX_SIZE.
+        # Must run before the crawl starts adding urls.
+        # Imported here since scraper imports this module
+        import scraper
+        Database.visited_urls = make_seen_set(config.seen_set, config.seen_set_error_rate)
+        Database.invalid_urls = make_seen_set(config.seen_set, config.seen_set_error_rate)
+        Database.unique_urls = make_seen_set(config.seen_set, config.seen_set_error_rate)
+        Database.tokens = TokenStats(
+            spill_threshold=config.token_spill_threshold, spill_dir=f"{path_name}/token_spill")
+        Database.content_hash = PermutedSimhashIndex(
+            max_distance=scraper.simhash_threshold, expected_size=config.simhash_index_size)
+
+
+    # Containers saved by crawler.checkpoint, each journals its own changes
+    checkpointed = ("visited_urls", "invalid_urls", "unique_urls", "content_hash", "tokens")
+
+
+    @staticmethod
+    def start_journal():
+        for name in Database.checkpointed:
+            getattr(Database, name).start_journal()
+
+
+    @staticmethod
+    def drain_delta():
+        # Changes since the last drain or snapshot. longest_page and
+        # subdomains are small, so they are saved whole every time.
+        delta = {name: getattr(Database, name).drain_journal() for name in Database.checkpointed}
+        with Database.lock:
+            delta["longest_page"] = list(Database.longest_page)
+            delta["subdomains"] = dict(Database.subdomains)
+        return delta
+
+
+    @staticmethod
+    def restore_delta(delta):
+        # Returns a drained delta to the journals after its write failed.
+        # longest_page and subdomains are saved whole, they need nothing.
+        for name in Database.checkpointed:
+            getattr(Database, name).restore_journal(delta[name])
+
+
+    @staticmethod
+    def apply_delta(delta):
+        for name in Database.checkpointed:
+            getattr(Database, name).replay(delta[name])
+        with Database.lock:
+            Database.longest_page = delta["longest_page"]
+            Database.subdomains = delta["subdomains"]
+
+
+    @staticmethod
+    def snapshot_state():
+        state = {name: (type(getattr(Database, name)), getattr(Database, name).snapshot())
+                 for name in Database.checkpointed}
+        with Database.lock:
+            state["longest_page"] = list(Database.longest_page)
+            state["subdomains"] = dict(Database.subdomains)
+        return state
+
+
+    @staticmethod
+    def restore_state(state):
+        max_distance, blocks = Database.content_hash.max_distance, Database.content_hash.blocks
+        for name in Database.checkpointed:
+            container_type, container_state = state[name]
+            setattr(Database, name, container_type.from_snapshot(container_state))
+        if (Database.content_hash.max_distance, Database.content_hash.blocks) != (max_distance, blocks):
+            # The checkpoint was taken with another simhash_threshold or
+            # SIMHASH_INDEX_SIZE, index its fingerprints for the current ones
+            content_hash = PermutedSimhashIndex(max_distance=max_distance, blocks=blocks)
+            content_hash.merge(Database.content_hash)
+            Database.content_hash = content_hash
+        with Database.lock:
+            Database.longest_page = state["longest_page"]
+            Database.subdomains = state["subdomains"]
+
+
+    @staticmethod
+    def merge_state(state):
+        # Adds the stats of another crawler, e.g. one node of a distributed crawl
+        for name in Database.checkpointed:
+            container_type, container_state = state[name]
+            getattr(Database, name).merge(container_type.from_snapshot(container_state))
+        with Database.lock:
+            if state["longest_page"][1] > Database.longest_page[1]:
+                Database.longest_page = list(state["longest_page"])
+            for subdomain, count in state["subdomains"].items():
+                Database.subdomains[subdomain] = Database.subdomains.get(subdomain, 0) + count
 
 
     @staticmethod
@@ -32,55 +135,95 @@ class Database:
         os.makedirs(path_name, exist_ok=True)
         print ("Writing data...\n")
         try:
-            Database.write_unique_urls()
-            Database.write_longest_page()
-            Database.write_common_tokens()
-            Database.write_subdomains()
+            Database.write_reports(Database.report_snapshot())
 
         except Exception as e:
             print(e)
+
+
+    @staticmethod
+    def report_snapshot():
+        # is_valid updates unique_urls and subdomains under Database.lock, so
+        # they are copied together. The workers only wait for the copies,
+        # the reports are written from the snapshot without any lock.
+        with Database.lock:
+            unique_count = len(Database.unique_urls)
+            # Compact seen sets only keep fingerprints, not the urls themselves
+            unique_urls = list(Database.unique_urls) if Database.unique_urls.retains_urls else None
+            longest_page = list(Database.longest_page)
+            subdomains = dict(Database.subdomains)
+        return ReportSnapshot(unique_count, unique_urls, longest_page, subdomains, Database.tokens.copy())
+
+
+    @staticmethod
+    def write_reports(snapshot, directory=path_name):
+        # Safe to run mid-crawl: each report replaces the previous one in one
+        # step, so a reader never sees half a file.
+        os.makedirs(directory, exist_ok=True)
+        Database.write_unique_urls(snapshot, directory)
+        Database.write_longest_page(snapshot, directory)
+        Database.write_common_tokens(snapshot, directory)
+        Database.write_subdomains(snapshot, directory)
+
+
+    @staticmethod
+    def _write_report(directory, name, lines):
+        # lines: an iterable of strings, streamed through a 1 MiB buffer
+        path = os.path.join(directory, name)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", buffering=1 << 20) as f:
+            f.writelines(lines)
+        os.replace(temp_path, path)
     
 
     @staticmethod
-    def write_unique_urls():
-        with open(f"{path_name}/unique_urls.txt", "w") as f:
-            f.write(f"Total unique urls found: {len(Database.unique_urls)}\n\n")
-            f.writelines(f"{url}\n" for url in Database.unique_urls)
+    def write_unique_urls(snapshot, directory=path_name):
+        header = f"Total unique urls found: {snapshot.unique_count}\n\n"
+        urls = (f"{url}\n" for url in snapshot.unique_urls or ())
+        Database._write_report(directory, "unique_urls.txt", chain((header,), urls))
 
 
     @staticmethod
-    def write_longest_page():
-        with open(f"{path_name}/longest_page.txt", "w") as f:
-            f.write(f"{Database.longest_page[0]} {Database.longest_page[1]}\n")
+    def write_longest_page(snapshot, directory=path_name):
+        Database._write_report(
+            directory, "longest_page.txt", (f"{snapshot.longest_page[0]} {snapshot.longest_page[1]}\n",))
 
 
     @staticmethod
-    def write_common_tokens():
-        top_common_words = sorted(((token, count) for token, count in Database.tokens.items() if token not in stop_words), key=lambda item: item[1], reverse=True)[:50]
-        with open(f"{path_name}/tokens.txt", "w") as f:
-            f.writelines(f"{token} {count}\n" for token, count in top_common_words)
+    def write_common_tokens(snapshot, directory=path_name):
+        top_common_words = snapshot.tokens.most_common(50, exclude=stop_words)
+        Database._write_report(
+            directory, "tokens.txt", (f"{token} {count}\n" for token, count in top_common_words))
 
 
     @staticmethod
-    def write_subdomains():
-        with open(f"{path_name}/subdomains.txt", "w") as f:
-            f.writelines(f"{subdomain} {count}\n" for subdomain, count in sorted(Database.subdomains.items()))
+    def write_subdomains(snapshot, directory=path_name):
+        Database._write_report(
+            directory, "subdomains.txt",
+            (f"{subdomain} {count}\n" for subdomain, count in sorted(snapshot.subdomains.items())))
 
 
     @staticmethod
     def tokenize(url, text):
-        tokens = [token for token in token_pattern.findall(text.lower()) if len(token) >= min_token_length]
+        token_dict, token_count = Database.count_tokens(text)
+        Database.add_tokens(url, token_dict, token_count)
+
 
-        # Find the longest page including stop words in problem 2
-        token_count = len(tokens)
-        if token_count > Database.longest_page[1]:
-            Database.longest_page = [url, token_count]
+    @staticmethod
+    def count_tokens(text):
+        # Pure counting step, safe to run in a parse process
+        return count_tokens(text)
+
+
+    @staticmethod
+    def add_tokens(url, token_dict, token_count):
+        with Database.lock:
+            # Find the longest page including stop words in problem 2
+            if token_count > Database.longest_page[1]:
+                Database.longest_page = [url, token_count]
 
-        token_dict = Counter(tokens)
-        
         # Save and count the occurence of each token in problem 3
-        for token, count in token_dict.items():
-            Database.tokens[token] = Database.tokens.get(token, 0) + count
+        Database.tokens.update(token_dict)
 
 
 # A set of stop words that will be ignored when finding the most common words in problem 3
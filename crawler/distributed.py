@@ -0,0 +1,235 @@
+import multiprocessing
+import os
+import zlib
+
+from functools import partial
+from multiprocessing.connection import wait
+from threading import Thread, Lock, Event, BrokenBarrierError
+
+from crawler import Crawler
+from crawler.checkpoint import start_checkpointer, dump, load
+from crawler.database import Database as db, path_name
+from crawler.frontier import Frontier
+from crawler.page_cache import close_page_cache
+from crawler.parse_pool import close_parse
+from crawler.report import ReportWriter
+from utils import get_logger, configure_logging, normalize
+from utils.metrics import metrics
+import scraper
+
+
+# Longest an idle node waits before asking whether the other nodes are done
+idle_poll_interval = 0.05
+
+
+def shard_of(host, nodes):
+    # crc32 rather than hash() so every process agrees on the owner
+    return zlib.crc32(host.encode("utf-8")) % nodes
+
+
+def node_path(path, node_id):
+    root, extension = os.path.splitext(path)
+    return f"{root}.node{node_id}{extension}"
+
+
+class ShardedFrontier(Frontier):
+    '''
+    Frontier of one node in a distributed crawl. Hosts are partitioned over
+    the nodes by shard_of, and a node only queues, validates and downloads
+    urls of its own hosts. Outlinks of other hosts are buffered per node and
+    forwarded in batches of `forward_batch_size`, or every
+    `forward_interval` seconds, through the multiprocessing queue of the
+    owner, which validates them with scraper.is_valid on arrival.
+
+    `outstanding` is shared by all nodes and counts urls queued, being
+    downloaded or in transit anywhere. A node with nothing left to do keeps
+    polling until it drops to 0, since other nodes may still forward urls.
+    Every node stops handing out urls once `shutdown` is set, as when
+    another node dies and `outstanding` can never drop to 0.
+    '''
+
+    def __init__(self, config, restart, node_id, nodes, inboxes, outstanding, shutdown):
+        self.node_id = node_id
+        self.nodes = nodes
+        self.inboxes = inboxes
+        self.outstanding = outstanding
+        self.shutdown = shutdown
+        self.outboxes = [list() for _ in range(nodes)]
+        self.outbox_lock = Lock()
+        self.stopped = Event()
+        super().__init__(config, restart)
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+        self.forwarder = Thread(target=self._forward_periodically, daemon=True)
+        self.forwarder.start()
+
+    def owns(self, url):
+        return shard_of(self._get_host(url), self.nodes) == self.node_id
+
+    def _add_outstanding(self, count):
+        with self.outstanding.get_lock():
+            self.outstanding.value += count
+
+    def add_url(self, url):
+        url = normalize(url)
+        node = shard_of(self._get_host(url), self.nodes)
+        if node == self.node_id:
+            super().add_url(url)
+            return
+        with self.outbox_lock:
+            self._add_outstanding(1)
+            self.outboxes[node].append(url)
+            if len(self.outboxes[node]) >= self.config.forward_batch_size:
+                self._send(node)
+
+    def _send(self, node):
+        # Must be called with the outbox lock held.
+        batch, self.outboxes[node] = self.outboxes[node], list()
+        if batch:
+            self.inboxes[node].put(batch)
+            metrics.inc("forwarded_urls", len(batch))
+
+    def _forward_periodically(self):
+        while not self.stopped.wait(self.config.forward_interval):
+            with self.outbox_lock:
+                for node in range(self.nodes):
+                    self._send(node)
+
+    def _receive(self):
+        inbox = self.inboxes[self.node_id]
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                return
+            for url in batch:
+                try:
+                    if scraper.is_valid(url):
+                        super().add_url(url)
+                except Exception as e:
+                    self.logger.error(f"Failed to add forwarded url {url}: {e}")
+            # Counted as queued by _enqueue before they stop counting as in transit
+            self._add_outstanding(-len(batch))
+
+    def _enqueue(self, url):
+        super()._enqueue(url)
+        self._add_outstanding(1)
+
+    def _pop_valid_url(self, host):
+        queued = len(self.to_be_downloaded[host])
+        url = super()._pop_valid_url(host)
+        dropped = queued - len(self.to_be_downloaded.get(host, ())) - (url is not None)
+        if dropped:
+            self._add_outstanding(-dropped)
+        return url
+
+    def _mark_url_complete(self, url, resp, elapsed):
+        super()._mark_url_complete(url, resp, elapsed)
+        self._add_outstanding(-1)
+
+    def poll_tbd_url(self):
+        if self.shutdown.is_set():
+            with self.lock:
+                # Wake the other waiting workers so they can stop as well.
+                self._notify_all()
+            return None, None
+        url, wait_time = super().poll_tbd_url()
+        if url is None and wait_time is None and self.outstanding.value > 0:
+            return None, idle_poll_interval
+        return url, wait_time
+
+    def close(self):
+        self.stopped.set()
+        self.forwarder.join()
+        self.inboxes[self.node_id].put(None)
+        self.receiver.join()
+
+
+def run_node(node_id, nodes, config, restart, inboxes, outstanding, shutdown, barrier):
+    # Entry point of one node process. Its interim reports go to
+    # data/node<id>/ and its stats to data/node<id>.state for the merge.
+    config.save_file = node_path(config.save_file, node_id)
+    config.checkpoint_dir = os.path.join(config.checkpoint_dir, f"node{node_id}")
+    config.page_cache_file = node_path(config.page_cache_file, node_id)
+    if config.archive_dir:
+        config.archive_dir = os.path.join(config.archive_dir, f"node{node_id}")
+    if config.metrics_port:
+        config.metrics_port += node_id
+    configure_logging(config)
+    db.configure(config)
+    checkpointer = start_checkpointer(config, restart)
+    metrics.configure(config)
+    metrics.start()
+    report_writer = ReportWriter(config, os.path.join(path_name, f"node{node_id}"))
+    report_writer.start()
+    frontier_factory = partial(
+        ShardedFrontier, node_id=node_id, nodes=nodes, inboxes=inboxes, outstanding=outstanding,
+        shutdown=shutdown)
+    try:
+        if config.engine == "async":
+            from crawler.async_worker import AsyncCrawler
+            crawler = AsyncCrawler(config, restart, frontier_factory)
+        else:
+            crawler = Crawler(config, restart, frontier_factory)
+        checkpointer.track(crawler.frontier)
+        # No node may decide the crawl is over before every node has loaded its shard
+        try:
+            barrier.wait()
+        except BrokenBarrierError:
+            # Another node died before the crawl started, shutdown is set
+            # so the crawl below stops at once
+            pass
+        crawler.start()
+        crawler.frontier.close()
+    finally:
+        report_writer.stop()
+        checkpointer.stop()
+        metrics.stop()
+        close_parse()
+        close_page_cache()
+        if config.archive_dir:
+            from crawler.page_archive import close_archive
+            close_archive()
+    os.makedirs(path_name, exist_ok=True)
+    with open(os.path.join(path_name, f"node{node_id}.state"), "wb") as f:
+        f.write(dump(db.snapshot_state()))
+
+
+def run_distributed(config, restart, nodes):
+    # Crawls with one process per node, then merges every node's stats into
+    # this process's Database.
+    logger = get_logger("DISTRIBUTED")
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue() for _ in range(nodes)]
+    outstanding = context.Value("q", 0)
+    shutdown = context.Event()
+    barrier = context.Barrier(nodes)
+    processes = [
+        context.Process(
+            target=run_node, args=(node_id, nodes, config, restart, inboxes, outstanding, shutdown, barrier),
+            name=f"node{node_id}")
+        for node_id in range(nodes)]
+    for process in processes:
+        process.start()
+    # A dead node never forwards or completes its urls, so the others would
+    # wait for it forever: stop them, they still save their stats.
+    running = {process.sentinel: node_id for node_id, process in enumerate(processes)}
+    while running:
+        for sentinel in wait(list(running)):
+            node_id = running.pop(sentinel)
+            processes[node_id].join()
+            if processes[node_id].exitcode != 0 and not shutdown.is_set():
+                logger.error(
+                    f"Node {node_id} exited with code {processes[node_id].exitcode}, "
+                    f"stopping the other nodes.")
+                shutdown.set()
+                barrier.abort()
+
+    for node_id, process in enumerate(processes):
+        state_path = os.path.join(path_name, f"node{node_id}.state")
+        if process.exitcode != 0 or not os.path.exists(state_path):
+            logger.error(f"Node {node_id} failed with exit code {process.exitcode}, its stats are missing.")
+            continue
+        with open(state_path, "rb") as f:
+            db.merge_state(load(f.read()))
+        os.remove(state_path)
+    logger.info(f"Merged the stats of {nodes} nodes.")
@@ -1,17 +1,51 @@
 import os
-import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
+from collections import defaultdict
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils.metrics import metrics
+import scraper
+from crawler.database import Database as db
+from crawler.frontier_store import open_store, remove_store
+from crawler.rate_control import RateController
 
 class Frontier(object):
+    # Predicate of the urls this frontier is responsible for, None for all of them
+    owns = None
+
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        # Stack of urls to be downloaded for each host
+        self.to_be_downloaded = defaultdict(list)
+        # Heap of (next allowed fetch time, host) for hosts that are waiting
+        # for a worker. A host being downloaded is not in the heap, so each
+        # host has at most one download in flight.
+        self.host_schedule = list()
+        self.scheduled_hosts = set()
+        self.active_hosts = set()
+        self.next_fetch_time = dict()
+        self.in_progress = 0
+        # Completed urls not yet written to the save file, see defer_completions
+        self.deferred_completions = None
+        self.lock = RLock()
+        self.host_ready = Condition(self.lock)
+        # Wake-up callbacks of async workers waiting for a url, by worker,
+        # see poll_tbd_url_or_wait
+        self.async_waiters = dict()
+        self.rates = RateController(
+            config.time_delay, config.rate_floor, config.rate_ceiling, config.rate_backoff,
+            config.rate_speedup, config.rate_latency_factor, host_budget=config.host_budget)
+        metrics.gauge("frontier_depth", self.depth)
+        metrics.gauge("frontier_in_progress", lambda: self.in_progress)
+        metrics.gauge("host_queue_size", self.host_queue_sizes)
+        metrics.gauge("host_delay", self.rates.delays)
+        metrics.gauge("host_error_rate", self.rates.error_rates)
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -22,51 +56,220 @@ class Frontier(object):
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            remove_store(self.config.save_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = open_store(self.config)
         if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
+            self._add_seeds()
         else:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
             if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+                self._add_seeds()
+
+    def _add_seeds(self):
+        # Seeds are validated and counted like discovered urls, each by the
+        # frontier that owns it, so a distributed crawl counts them the same
+        # as a single frontier does.
+        for url in self.config.seed_urls:
+            url = normalize(url)
+            if self.owns is not None and not self.owns(url):
+                continue
+            if scraper.is_valid(url):
+                self.add_url(url)
+            else:
+                self.logger.warning(f"Skipping seed {url}, rejected by scraper.is_valid.")
+
+    def defer_completions(self):
+        # From now on completed urls are only written to the save file by
+        # commit_completions, once the Database checkpoint holding their
+        # pages is on disk. After a crash, the urls completed since the last
+        # checkpoint are still pending and are downloaded again.
+        with self.lock:
+            self.deferred_completions = list()
+
+    def take_completions(self):
+        with self.lock:
+            completions, self.deferred_completions = self.deferred_completions or list(), list()
+            return completions
+
+    def commit_completions(self, completions):
+        with self.lock:
+            for urlhash, url in completions:
+                self.save[urlhash] = (url, True)
+
+    def restore_completions(self, completions):
+        # Completions taken for a checkpoint that could not be written
+        with self.lock:
+            self.deferred_completions[:0] = completions
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
+        # Only the pending urls are read. They were counted when they were
+        # discovered, so they are validated without side effects when dequeued.
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
+        with self.lock:
+            for url in self.save.pending_urls():
+                self._enqueue(url)
                 tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    @staticmethod
+    def _get_host(url):
+        return urlparse(url).netloc.lower()
+
+    def _enqueue(self, url):
+        with self.lock:
+            host = self._get_host(url)
+            self.to_be_downloaded[host].append(url)
+            self._schedule_host(host)
+
+    def _schedule_host(self, host):
+        # Must be called with the lock held.
+        if (host in self.active_hosts or host in self.scheduled_hosts
+                or not self.to_be_downloaded.get(host)):
+            return
+        heapq.heappush(self.host_schedule, (self.next_fetch_time.get(host, 0), host))
+        self.scheduled_hosts.add(host)
+        self._notify()
+
+    def _notify(self):
+        # Must be called with the lock held. Wakes one waiting worker.
+        self.host_ready.notify()
+        if self.async_waiters:
+            self.async_waiters.pop(next(iter(self.async_waiters)))()
+
+    def _notify_all(self):
+        # Must be called with the lock held.
+        self.host_ready.notify_all()
+        waiters, self.async_waiters = self.async_waiters, dict()
+        for wake in waiters.values():
+            wake()
+
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        # Block until some host may be fetched again. Returns None only when
+        # nothing is queued and no other worker can produce more urls.
+        with self.host_ready:
+            while True:
+                url, wait_time = self.poll_tbd_url()
+                if url or wait_time is None:
+                    return url
+                self.host_ready.wait(None if wait_time == float("inf") else wait_time)
+
+    def poll_tbd_url(self):
+        # Non-blocking version of get_tbd_url for the async engine.
+        # Returns (url, 0) when a url is ready, (None, seconds to wait) when
+        # no host is eligible yet, and (None, None) when crawling is done.
+        with self.lock:
+            while self.host_schedule:
+                fetch_time, host = self.host_schedule[0]
+                wait_time = fetch_time - time.monotonic()
+                if wait_time > 0:
+                    return None, wait_time
+                heapq.heappop(self.host_schedule)
+                self.scheduled_hosts.discard(host)
+                url = self._pop_valid_url(host)
+                if url is None:
+                    continue
+                self.active_hosts.add(host)
+                self.in_progress += 1
+                return url, 0
+            if self.in_progress == 0:
+                # Wake the other waiting workers so they can stop as well.
+                self._notify_all()
+                return None, None
+            # Wait for a worker to add or complete a url.
+            return None, float("inf")
+
+    def poll_tbd_url_or_wait(self, worker, wake):
+        # poll_tbd_url for the async engine. When no url is ready, `wake` is
+        # called (with the lock held) on the next notify, as if the worker
+        # waited on host_ready. It must not block.
+        with self.lock:
+            self.async_waiters.pop(worker, None)
+            url, wait_time = self.poll_tbd_url()
+            if url is None and wait_time is not None:
+                self.async_waiters[worker] = wake
+            return url, wait_time
+
+    def depth(self):
+        with self.lock:
+            return sum(len(urls) for urls in self.to_be_downloaded.values())
+
+    def host_queue_sizes(self):
+        with self.lock:
+            return {host: len(urls) for host, urls in self.to_be_downloaded.items()}
+
+    def _pop_valid_url(self, host):
+        # Must be called with the lock held. Returns None if every queued url
+        # of the host is no longer valid or the host is out of budget.
+        urls = self.to_be_downloaded[host]
+        url = None
+        if self.rates.budget_exhausted(host):
+            metrics.inc("rejected_urls", len(urls), reason="host_budget")
+            for candidate in urls:
+                self.save[get_urlhash(candidate)] = (candidate, True)
+            urls.clear()
+        while urls:
+            candidate = urls.pop()
+            if scraper.is_still_valid(candidate):
+                url = candidate
+                break
+            # Completed without a download, so it is not loaded on the next resume
+            metrics.inc("rejected_urls", reason="stale")
+            self.save[get_urlhash(candidate)] = (candidate, True)
+        if not urls:
+            del self.to_be_downloaded[host]
+        return url
 
     def add_url(self, url):
+        with metrics.timer("frontier_add"):
+            self._add_url(url)
+
+    def _subdomain_budget_exhausted(self, host):
+        # Database.subdomains counts the unique urls found on each subdomain,
+        # including this one, see scraper.is_valid
+        budget = self.config.subdomain_budget
+        return budget and db.subdomains.get(host, 0) > budget
+
+    def _add_url(self, url):
         url = normalize(url)
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
+        if self._subdomain_budget_exhausted(self._get_host(url)):
+            metrics.inc("rejected_urls", reason="subdomain_budget")
+            return
+        with self.lock:
+            if urlhash not in self.save:
+                self.save[urlhash] = (url, False)
+                self._enqueue(url)
     
-    def mark_url_complete(self, url):
+    def mark_url_complete(self, url, resp=None, elapsed=None):
+        # resp and elapsed are the download's Response and duration in
+        # seconds, resp is None if the download failed.
+        with metrics.timer("frontier_complete"):
+            self._mark_url_complete(url, resp, elapsed)
+
+    def _mark_url_complete(self, url, resp, elapsed):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with self.lock:
+            if urlhash not in self.save:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            if self.deferred_completions is not None:
+                self.deferred_completions.append((urlhash, url))
+            else:
+                self.save[urlhash] = (url, True)
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+            # The host may be fetched again once its delay has passed.
+            host = self._get_host(url)
+            self.active_hosts.discard(host)
+            self.in_progress -= 1
+            self.next_fetch_time[host] = time.monotonic() + self.rates.record(host, resp, elapsed)
+            self._schedule_host(host)
+            if self.in_progress == 0 and not self.host_schedule:
+                self._notify_all()
@@ -0,0 +1,176 @@
+import atexit
+import os
+import shelve
+import sqlite3
+
+from threading import Thread, RLock, Event
+
+
+def to_signed(urlhash):
+    # SQLite integers are signed 64-bit
+    return urlhash - (1 << 64) if urlhash >= (1 << 63) else urlhash
+
+
+class ShelveStore(object):
+    ''' The original backend: a shelve that is flushed after every write. '''
+
+    def __init__(self, path):
+        self.path = path
+        self.save = shelve.open(path)
+
+    @staticmethod
+    def _key(urlhash):
+        # Shelve keys must be strings
+        return f"{urlhash:016x}"
+
+    def __contains__(self, urlhash):
+        return self._key(urlhash) in self.save
+
+    def __getitem__(self, urlhash):
+        return self.save[self._key(urlhash)]
+
+    def __setitem__(self, urlhash, value):
+        self.save[self._key(urlhash)] = value
+        self.save.sync()
+
+    def __len__(self):
+        return len(self.save)
+
+    def values(self):
+        return self.save.values()
+
+    def pending_urls(self):
+        # Shelve has no secondary index, every entry is read
+        return (url for url, completed in self.save.values() if not completed)
+
+    def sync(self):
+        self.save.sync()
+
+    def close(self):
+        self.save.close()
+
+
+class SqliteStore(object):
+    '''
+    Frontier save file on SQLite in WAL mode with write-behind batching.
+
+    Writes are buffered in memory and committed as one transaction once
+    `batch_size` urls are pending or `flush_interval` seconds have passed.
+    Batches are committed in order, and a url is always added before the
+    page it was found on is marked complete. A crash can therefore only
+    lose the tail of the crawl: those pages are still incomplete on resume
+    and are downloaded again, rediscovering the lost urls.
+
+    A partial index over the incomplete urls lets a resume read only those,
+    however many urls have been completed.
+
+    Workers are daemon threads and may still run when the store is closed
+    at exit. From then on writes are dropped and every url reads as known,
+    so they neither queue new urls nor touch the closed connection.
+    '''
+
+    def __init__(self, path, batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = RLock()
+        # urlhash -> (url, completed) not committed yet, in insertion order
+        self.pending = dict()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash INTEGER PRIMARY KEY, url TEXT NOT NULL, completed INTEGER NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS pending_urls ON urls (urlhash) WHERE completed = 0")
+        self.connection.commit()
+
+        self.closed = Event()
+        self.flusher = Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+        # Commit the last batch when the crawler exits, including on Ctrl-C.
+        atexit.register(self.close)
+
+    def _flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            self.sync()
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            if urlhash in self.pending or self.closed.is_set():
+                return True
+            return self.connection.execute(
+                "SELECT 1 FROM urls WHERE urlhash = ?", (to_signed(urlhash),)).fetchone() is not None
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            if urlhash in self.pending:
+                return self.pending[urlhash]
+            if self.closed.is_set():
+                raise KeyError(urlhash)
+            row = self.connection.execute(
+                "SELECT url, completed FROM urls WHERE urlhash = ?", (to_signed(urlhash),)).fetchone()
+        if row is None:
+            raise KeyError(urlhash)
+        return row[0], bool(row[1])
+
+    def __setitem__(self, urlhash, value):
+        with self.lock:
+            if self.closed.is_set():
+                return
+            self.pending[urlhash] = value
+            if len(self.pending) >= self.batch_size:
+                self.sync()
+
+    def __len__(self):
+        with self.lock:
+            self.sync()
+            return self.connection.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def values(self):
+        with self.lock:
+            self.sync()
+            rows = self.connection.execute("SELECT url, completed FROM urls").fetchall()
+        return ((url, bool(completed)) for url, completed in rows)
+
+    def pending_urls(self):
+        with self.lock:
+            self.sync()
+            rows = self.connection.execute("SELECT url FROM urls WHERE completed = 0").fetchall()
+        return (url for url, in rows)
+
+    def sync(self):
+        with self.lock:
+            if not self.pending:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO urls (urlhash, url, completed) VALUES (?, ?, ?)",
+                    ((to_signed(urlhash), url, int(completed))
+                     for urlhash, (url, completed) in self.pending.items()))
+            self.pending.clear()
+
+    def close(self):
+        with self.lock:
+            if self.closed.is_set():
+                return
+            self.closed.set()
+            self.sync()
+            self.connection.close()
+
+
+def open_store(config):
+    if config.save_backend == "sqlite":
+        return SqliteStore(config.save_file, config.save_batch_size, config.save_flush_interval)
+    if config.save_backend == "shelve":
+        return ShelveStore(config.save_file)
+    raise ValueError(f"Unknown save backend {config.save_backend}")
+
+
+def remove_store(path):
+    # SQLite in WAL mode keeps two side files next to the database.
+    for file_path in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
@@ -0,0 +1,50 @@
+class Journaled(object):
+    '''
+    Mixin for Database containers that are checkpointed incrementally.
+
+    Subclasses guard their state with `self.lock`, call `_record(entry)`
+    with the lock held for every change, and implement `_copy_state`,
+    `_load_state` and `_replay`. A snapshot copies the state and resets
+    the journal in one critical section, so every change ends up in
+    exactly one of a snapshot or a later delta.
+    '''
+
+    journal = None
+
+    def start_journal(self):
+        with self.lock:
+            self.journal = list()
+
+    def _record(self, entry):
+        if self.journal is not None:
+            self.journal.append(entry)
+
+    def drain_journal(self):
+        with self.lock:
+            entries = self.journal or list()
+            if self.journal is not None:
+                self.journal = list()
+            return entries
+
+    def restore_journal(self, entries):
+        # Puts back entries drained for a delta that could not be written
+        with self.lock:
+            if self.journal is not None:
+                self.journal[:0] = entries
+
+    def replay(self, entries):
+        for entry in entries:
+            self._replay(entry)
+
+    def snapshot(self):
+        with self.lock:
+            state = self._copy_state()
+            if self.journal is not None:
+                self.journal = list()
+            return state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        instance = cls.__new__(cls)
+        instance._load_state(state)
+        return instance
@@ -0,0 +1,271 @@
+import mmap
+import os
+import re
+import struct
+import zlib
+
+from collections import namedtuple
+from threading import Lock
+
+import numpy as np
+
+from utils import get_logger, get_urlhash
+from utils.metrics import metrics
+
+
+# Each record is this header, then "<url>\n<response url>" and the zlib
+# compressed body: url fingerprint, status, url bytes, body bytes, crc32 of
+# the compressed body
+record_header = struct.Struct("<QHIII")
+# The index is this header, then the sorted fingerprints and their locations
+index_header = struct.Struct("<8sQI")
+index_magic = b"PGARCH01"
+index_name = "index.bin"
+segment_re = re.compile(r"segment-(\d{5})\.dat$")
+# A location is the segment number above the offset in the segment
+offset_bits = 40
+
+# A page read back from the archive, shaped like the Response it was saved from
+ArchivedPage = namedtuple("ArchivedPage", ["requested_url", "url", "status", "content"])
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"segment-{segment:05d}.dat")
+
+
+def list_segments(directory):
+    if not os.path.isdir(directory):
+        return list()
+    return sorted(int(match.group(1)) for match in map(segment_re.match, os.listdir(directory)) if match)
+
+
+def archive_directories(directory):
+    # The archive and the archives of the nodes of a distributed crawl
+    directories = [directory] if list_segments(directory) else list()
+    if os.path.isdir(directory):
+        directories += [
+            os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith("node") and list_segments(os.path.join(directory, name))]
+    return directories
+
+
+def decode_record(data, offset):
+    # (fingerprint, ArchivedPage, end offset) of the record at offset, or
+    # None if it is cut short or damaged
+    if offset + record_header.size > len(data):
+        return None
+    fingerprint, status, meta_length, data_length, crc = record_header.unpack_from(data, offset)
+    start = offset + record_header.size + meta_length
+    end = start + data_length
+    if end > len(data) or zlib.crc32(data[start:end]) != crc:
+        return None
+    meta = bytes(data[offset + record_header.size:start]).decode("utf-8")
+    requested_url, url = meta.split("\n", 1)
+    content = zlib.decompress(data[start:end])
+    return fingerprint, ArchivedPage(requested_url, url, status, content), end
+
+
+def scan_segment(path):
+    # (fingerprint, offset, page) of every whole record, in the order written
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            while True:
+                record = decode_record(data, offset)
+                if record is None:
+                    return
+                fingerprint, page, end = record
+                yield fingerprint, offset, page
+                offset = end
+
+
+def read_index(directory):
+    # (fingerprints, locations, segments covered), memory-mapped
+    path = os.path.join(directory, index_name)
+    if not os.path.exists(path):
+        return np.empty(0, np.uint64), np.empty(0, np.uint64), 0
+    with open(path, "rb") as f:
+        magic, count, covered = index_header.unpack(f.read(index_header.size))
+    if magic != index_magic:
+        raise ValueError(f"{path} is not a page archive index")
+    if count == 0:
+        return np.empty(0, np.uint64), np.empty(0, np.uint64), covered
+    fingerprints = np.memmap(path, "<u8", "r", index_header.size, (count,))
+    locations = np.memmap(path, "<u8", "r", index_header.size + 8 * count, (count,))
+    return fingerprints, locations, covered
+
+
+def update_index(directory, known=None):
+    '''
+    Rewrites the index of `directory` to cover all its segments. Segments
+    the old index covers are taken from it, `known` maps segments to
+    their (fingerprint, location) entries, and any other segment (left by
+    a crash) is scanned. A url archived more than once keeps its latest
+    record.
+    '''
+    known = known or dict()
+    fingerprints, locations, covered = read_index(directory)
+    segments = list_segments(directory)
+    new_fingerprints, new_locations = [np.asarray(fingerprints, np.uint64)], [np.asarray(locations, np.uint64)]
+    for segment in segments:
+        if segment < covered:
+            continue
+        if segment in known:
+            entries = known[segment]
+        else:
+            entries = [(fingerprint, (segment << offset_bits) | offset)
+                       for fingerprint, offset, _ in scan_segment(segment_path(directory, segment))]
+        new_fingerprints.append(np.fromiter((entry[0] for entry in entries), np.uint64, len(entries)))
+        new_locations.append(np.fromiter((entry[1] for entry in entries), np.uint64, len(entries)))
+    fingerprints, locations = np.concatenate(new_fingerprints), np.concatenate(new_locations)
+
+    # Later records have larger locations, keep the last one of each fingerprint
+    order = np.lexsort((locations, fingerprints))
+    fingerprints, locations = fingerprints[order], locations[order]
+    last = np.append(fingerprints[1:] != fingerprints[:-1], True) if len(fingerprints) else np.empty(0, bool)
+    fingerprints, locations = fingerprints[last], locations[last]
+
+    path = os.path.join(directory, index_name)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(index_header.pack(index_magic, len(fingerprints), (segments[-1] + 1) if segments else 0))
+        f.write(fingerprints.astype("<u8").tobytes())
+        f.write(locations.astype("<u8").tobytes())
+    os.replace(temp_path, path)
+    return len(fingerprints)
+
+
+class PageArchive(object):
+    '''
+    Append-only archive of the downloaded pages, for re-analysis without
+    the cache server. Pages are appended, zlib compressed, to segment files
+    of about `segment_size` bytes; every run starts a new segment, so old
+    segments are never written again. On close, the sorted index of url
+    fingerprint to segment and offset is updated, and ArchiveReader
+    memory-maps it for lookups.
+    '''
+
+    def __init__(self, directory, segment_size, compression_level=6):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compression_level = compression_level
+        self.lock = Lock()
+        self.logger = get_logger("ARCHIVE")
+        os.makedirs(directory, exist_ok=True)
+        segments = list_segments(directory)
+        self.segment = (segments[-1] + 1) if segments else 0
+        self.file = None
+        self.size = 0
+        # segment -> (fingerprint, location) of the records written by this run
+        self.entries = dict()
+        self.count = 0
+
+    def _roll(self):
+        # Must be called with the lock held.
+        if self.file is not None:
+            self.file.close()
+            self.segment += 1
+        self.file = open(segment_path(self.directory, self.segment), "ab")
+        self.size = 0
+        self.entries[self.segment] = list()
+
+    def add(self, url, resp):
+        # Archives a downloaded page, pages without a body are skipped
+        if resp is None or resp.status != 200 or not resp.content:
+            return False
+        fingerprint = get_urlhash(url)
+        meta = f"{url}\n{resp.url or url}".encode("utf-8")
+        data = zlib.compress(resp.content, self.compression_level)
+        header = record_header.pack(fingerprint, resp.status, len(meta), len(data), zlib.crc32(data))
+        with self.lock:
+            if self.file is None or self.size >= self.segment_size:
+                self._roll()
+            self.entries[self.segment].append((fingerprint, (self.segment << offset_bits) | self.size))
+            self.file.write(header)
+            self.file.write(meta)
+            self.file.write(data)
+            self.size += len(header) + len(meta) + len(data)
+            self.count += 1
+        metrics.inc("archived_pages")
+        return True
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            total = update_index(self.directory, self.entries)
+        self.logger.info(f"Archived {self.count} pages, {total} urls in {self.directory}")
+
+
+class ArchiveReader(object):
+    ''' Reads a PageArchive: lookups by url through the index, or every page in disk order. '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        segments = list_segments(directory)
+        if read_index(directory)[2] < ((segments[-1] + 1) if segments else 0):
+            # Segments of a crawl that did not close its archive
+            update_index(directory)
+        self.fingerprints, self.locations, _ = read_index(directory)
+        self.segments = dict()
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def _segment(self, segment):
+        if segment not in self.segments:
+            with open(segment_path(self.directory, segment), "rb") as f:
+                self.segments[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.segments[segment]
+
+    def get(self, url):
+        fingerprint = np.uint64(get_urlhash(url))
+        index = int(np.searchsorted(self.fingerprints, fingerprint))
+        if index == len(self.fingerprints) or self.fingerprints[index] != fingerprint:
+            return None
+        location = int(self.locations[index])
+        record = decode_record(self._segment(location >> offset_bits), location & ((1 << offset_bits) - 1))
+        return record[1] if record else None
+
+    def __iter__(self):
+        # Pages in the order they were archived, read sequentially from the
+        # segments. A url archived again is only read at its latest record.
+        locations = np.sort(self.locations)
+        offset_mask = (1 << offset_bits) - 1
+        for start in range(0, len(locations), 1 << 16):
+            for location in locations[start:start + (1 << 16)].tolist():
+                record = decode_record(self._segment(location >> offset_bits), location & offset_mask)
+                if record is not None:
+                    yield record[1]
+
+    def close(self):
+        for data in self.segments.values():
+            data.close()
+        self.segments.clear()
+
+
+shared_archive = None
+shared_archive_lock = Lock()
+
+
+def get_archive(config):
+    # The page archive shared by the workers, or None without ARCHIVE_DIR
+    global shared_archive
+    if not config.archive_dir:
+        return None
+    with shared_archive_lock:
+        if shared_archive is None:
+            shared_archive = PageArchive(config.archive_dir, config.archive_segment_size)
+    return shared_archive
+
+
+def close_archive():
+    # Indexes the pages archived by this crawl, if it archived any
+    global shared_archive
+    with shared_archive_lock:
+        if shared_archive is not None:
+            shared_archive.close()
+            shared_archive = None
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import pickle
+
+from collections import namedtuple, OrderedDict, Counter
+from threading import Lock
+
+from crawler.checkpoint import dump, load
+from utils import get_logger, get_urlhash
+from utils.metrics import metrics
+
+
+# What is kept of a page between crawls: its validators, a hash of its body
+# and the scraper.ParsedPage (outlinks, simhash, token counts)
+CachedPage = namedtuple("CachedPage", ["etag", "last_modified", "content_hash", "page"])
+
+
+def content_hash(content):
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def entry_size(entry):
+    # Bytes the entry takes in the saved cache, before compression
+    return len(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class PageCache(object):
+    '''
+    Pages parsed in this or a previous crawl, keyed by url fingerprint and
+    evicted least recently used once they take more than `capacity` bytes.
+
+    On a 200 whose body hashes to the cached one, the cached ParsedPage is
+    merged into the Database instead of parsing the page again. With
+    `conditional`, downloads of a cached page also carry If-None-Match /
+    If-Modified-Since, and a 304 is served from the cache the same way.
+    The cache is loaded from and saved to `path`, and survives --restart.
+    '''
+
+    def __init__(self, path, capacity, conditional=False):
+        self.path = path
+        self.capacity = capacity
+        self.conditional = conditional
+        self.entries = OrderedDict()
+        # Size of each entry and of all of them, in bytes
+        self.sizes = dict()
+        self.size = 0
+        self.lock = Lock()
+        # not_modified and unchanged hits, misses and evictions
+        self.counts = Counter()
+        self.logger = get_logger("PAGE_CACHE")
+
+    def _get(self, url):
+        key = get_urlhash(url)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def conditional_headers(self, url):
+        headers = dict()
+        if not self.conditional:
+            return headers
+        entry = self._get(url)
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def lookup(self, url, resp):
+        # The cached ParsedPage if the page did not change, else None
+        entry = self._get(url)
+        if entry is None:
+            result = "miss"
+        elif resp.status == 304:
+            result = "not_modified"
+        elif resp.content and content_hash(resp.content) == entry.content_hash:
+            result = "unchanged"
+        else:
+            result = "miss"
+        self._count(result)
+        return entry.page if result != "miss" else None
+
+    def store(self, url, resp, page):
+        headers = resp.headers
+        entry = CachedPage(headers.get("etag"), headers.get("last-modified"), content_hash(resp.content), page)
+        key = get_urlhash(url)
+        size = entry_size(entry)
+        evicted = 0
+        with self.lock:
+            self.size += size - self.sizes.get(key, 0)
+            self.entries[key] = entry
+            self.sizes[key] = size
+            self.entries.move_to_end(key)
+            while self.size > self.capacity and self.entries:
+                old_key, _ = self.entries.popitem(last=False)
+                self.size -= self.sizes.pop(old_key)
+                evicted += 1
+        if evicted:
+            self._count("evicted", evicted)
+
+    def _count(self, result, amount=1):
+        with self.lock:
+            self.counts[result] += amount
+        metrics.inc("page_cache", amount, result=result)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                entries = load(f.read())
+        except Exception as e:
+            self.logger.error(f"Ignoring unreadable page cache {self.path}: {e}")
+            return
+        # The most recently used pages are last, keep those if the capacity shrank
+        kept = list()
+        for key, entry in reversed(entries.items()):
+            size = entry_size(entry)
+            if self.size + size > self.capacity:
+                break
+            kept.append((key, entry))
+            self.sizes[key] = size
+            self.size += size
+        self.entries = OrderedDict(reversed(kept))
+        self.logger.info(f"Loaded {len(self.entries)} cached pages, {self.size >> 10} KiB from {self.path}")
+
+    def save(self):
+        with self.lock:
+            entries = OrderedDict(self.entries)
+            counts = dict(self.counts)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(dump(entries))
+        os.replace(temp_path, self.path)
+        self.logger.info(f"Saved {len(entries)} cached pages, {counts}")
+
+
+shared_cache = None
+shared_cache_lock = Lock()
+
+
+def get_page_cache(config):
+    # The page cache shared by the workers, or None with PAGE_CACHE_SIZE = 0
+    global shared_cache
+    if config.page_cache_size <= 0:
+        return None
+    with shared_cache_lock:
+        if shared_cache is None:
+            shared_cache = PageCache(config.page_cache_file, config.page_cache_size, config.page_cache_conditional)
+            shared_cache.load()
+    return shared_cache
+
+
+def close_page_cache():
+    # Saves the shared page cache, if the crawl used one
+    global shared_cache
+    with shared_cache_lock:
+        if shared_cache is not None:
+            shared_cache.save()
+            shared_cache = None
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+import scraper
+
+
+# scraper.py settings the parse processes use. A spawned process imports
+# scraper afresh, so values set at runtime are passed on explicitly.
+scraper_settings = ("extractor_engine", "text_features_engine", "lower_bound")
+
+
+def configure_scraper(settings):
+    # Initializer of each parse process
+    for name, value in settings.items():
+        setattr(scraper, name, value)
+
+
+class ParsePool(object):
+    '''
+    Parse stage running scraper.parse_page in worker processes, so parsing
+    is not serialized by the GIL of the fetch threads. Workers hand over the
+    raw page bytes and get back a compact ParsedPage, which the calling
+    thread merges into the Database. The workers start with the
+    scraper_settings the creating process had.
+    '''
+
+    def __init__(self, processes):
+        # Spawn rather than fork: the crawler already runs threads holding locks.
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"), initializer=configure_scraper,
+            initargs=({name: getattr(scraper, name) for name in scraper_settings},))
+
+    def parse(self, content, base_url=None):
+        return self.executor.submit(scraper.parse_page, content, base_url).result()
+
+    def parse_batch(self, contents, base_urls=None):
+        # Future of scraper.parse_pages for a whole batch
+        return self.executor.submit(scraper.parse_pages, contents, base_urls)
+
+    def map(self, contents, chunksize=1):
+        return self.executor.map(scraper.parse_page, contents, chunksize=chunksize)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+shared_pool = None
+shared_pool_lock = Lock()
+
+
+def get_parse(config):
+    # Returns the parse callable for scraper.scraper: None to parse in the
+    # calling thread, or the shared pool's parse when PARSE_PROCESSES > 0.
+    global shared_pool
+    if config.parse_processes <= 0:
+        return None
+    with shared_pool_lock:
+        if shared_pool is None:
+            shared_pool = ParsePool(config.parse_processes)
+    return shared_pool.parse
+
+
+def close_parse():
+    # Stops the shared parse processes, if the crawl started them
+    global shared_pool
+    with shared_pool_lock:
+        if shared_pool is not None:
+            shared_pool.close()
+            shared_pool = None
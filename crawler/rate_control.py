@@ -0,0 +1,83 @@
+# Smallest delay a failure backs off from, so a host at a 0 delay still slows down
+min_backoff_delay = 0.1
+
+
+class HostRate(object):
+    __slots__ = ("delay", "latency", "error_rate", "downloads")
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.latency = None
+        self.error_rate = 0.0
+        self.downloads = 0
+
+
+class RateController(object):
+    '''
+    Delay between two downloads from the same host, adapted to how the host
+    responds. Every host starts at `initial` seconds. A failed download (a
+    5xx or 6xx status from the cache server, or no response at all, e.g. a
+    timeout) multiplies the delay by `backoff`, up to `ceiling`, starting
+    from at least `floor` (or `initial`, or min_backoff_delay if both are 0). A successful one
+    multiplies it by `speedup`, down to `floor` but never below
+    `latency_factor` times the host's average response time, so slow hosts
+    are given more room. Response time and error rate are EWMAs with
+    weight `alpha`.
+
+    `host_budget` caps the pages downloaded from one host, 0 for no cap.
+    Not thread safe: the Frontier calls it with its lock held.
+    '''
+
+    def __init__(self, initial, floor, ceiling, backoff=2.0, speedup=0.9,
+                 latency_factor=1.0, alpha=0.2, host_budget=0):
+        self.floor = floor
+        self.initial = max(initial, floor)
+        self.ceiling = max(ceiling, self.initial)
+        self.backoff = backoff
+        self.speedup = speedup
+        self.latency_factor = latency_factor
+        self.alpha = alpha
+        self.host_budget = host_budget
+        self.hosts = dict()
+
+    def _get(self, host):
+        rate = self.hosts.get(host)
+        if rate is None:
+            rate = self.hosts[host] = HostRate(self.initial)
+        return rate
+
+    @staticmethod
+    def failed(resp):
+        return resp is None or resp.status is None or resp.status >= 500
+
+    def record(self, host, resp=None, elapsed=None):
+        # Updates the host after a download and returns its new delay
+        rate = self._get(host)
+        rate.downloads += 1
+        failed = self.failed(resp)
+        rate.error_rate += self.alpha * ((1.0 if failed else 0.0) - rate.error_rate)
+        if elapsed is not None:
+            rate.latency = elapsed if rate.latency is None else rate.latency + self.alpha * (elapsed - rate.latency)
+        if failed:
+            step = max(rate.delay, self.floor or self.initial or min_backoff_delay)
+            rate.delay = min(self.ceiling, step * self.backoff)
+        else:
+            floor = max(self.floor, self.latency_factor * (rate.latency or 0.0))
+            rate.delay = min(self.ceiling, max(floor, rate.delay * self.speedup))
+        return rate.delay
+
+    def delay(self, host):
+        rate = self.hosts.get(host)
+        return rate.delay if rate else self.initial
+
+    def budget_exhausted(self, host):
+        if not self.host_budget:
+            return False
+        rate = self.hosts.get(host)
+        return rate is not None and rate.downloads >= self.host_budget
+
+    def delays(self):
+        return {host: rate.delay for host, rate in self.hosts.items()}
+
+    def error_rates(self):
+        return {host: rate.error_rate for host, rate in self.hosts.items()}
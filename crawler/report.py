@@ -0,0 +1,48 @@
+from threading import Thread, Event
+
+from crawler.database import Database as db, path_name
+from utils import get_logger
+
+
+class ReportWriter(object):
+    '''
+    Writes interim reports to `directory` every `interval` seconds while
+    the crawl runs, so a long crawl can be inspected before it ends.
+    Each report is written from Database.report_snapshot, so the workers
+    only wait for the copy, not for the files.
+    '''
+
+    def __init__(self, config, directory=path_name):
+        self.interval = config.report_interval
+        self.directory = directory
+        self.logger = get_logger("REPORT")
+        self.stopped = Event()
+        self.thread = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        # The final report is written by Database.write_all
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def write(self):
+        try:
+            snapshot = db.report_snapshot()
+            db.write_reports(snapshot, self.directory)
+            self.logger.info(f"Wrote interim report ({snapshot.unique_count} unique urls)")
+        except Exception as e:
+            self.logger.error(f"Interim report failed: {e}")
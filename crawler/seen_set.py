@@ -0,0 +1,236 @@
+import math
+from array import array
+from threading import Lock
+
+from utils import get_urlhash
+from crawler.journal import Journaled
+
+
+class ExactSeenSet(Journaled):
+    ''' Keeps every url string, the original behaviour. '''
+
+    retains_urls = True
+
+    def __init__(self):
+        self.urls = set()
+        self.lock = Lock()
+
+    def add(self, url):
+        with self.lock:
+            if url not in self.urls:
+                self.urls.add(url)
+                self._record(url)
+
+    def _copy_state(self):
+        return set(self.urls)
+
+    def _load_state(self, state):
+        self.urls = state
+        self.lock = Lock()
+
+    def _replay(self, url):
+        self.add(url)
+
+    def merge(self, other):
+        for url in list(other.urls):
+            self.add(url)
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __iter__(self):
+        return iter(list(self.urls))
+
+    def __len__(self):
+        return len(self.urls)
+
+
+class FingerprintSeenSet(Journaled):
+    '''
+    Keeps a 64-bit fingerprint per url in an open-addressing table backed by
+    an array. The table doubles once half full, so its load factor is
+    between a quarter and a half: 16 to 32 bytes per url (28 measured by
+    bench_seen_set for 300,000 urls). Two urls share a fingerprint with
+    probability ~n/2^64.
+    '''
+
+    retains_urls = False
+
+    def __init__(self, capacity=1 << 16):
+        capacity = 1 << max(4, (capacity - 1).bit_length())
+        # The table and its mask are swapped together when the table grows,
+        # so lookups without the lock always see a consistent pair.
+        self._table = (array("Q", [0]) * capacity, capacity - 1)
+        self.count = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def _fingerprint(url):
+        # Zero marks an empty slot
+        return get_urlhash(url) or 1
+
+    @staticmethod
+    def _insert(table, mask, fingerprint):
+        i = fingerprint & mask
+        while True:
+            stored = table[i]
+            if stored == fingerprint:
+                return False
+            if stored == 0:
+                table[i] = fingerprint
+                return True
+            i = (i + 1) & mask
+
+    def _grow(self):
+        old_table, _ = self._table
+        capacity = len(old_table) * 2
+        table, mask = array("Q", [0]) * capacity, capacity - 1
+        for fingerprint in old_table:
+            if fingerprint:
+                self._insert(table, mask, fingerprint)
+        self._table = (table, mask)
+
+    def add(self, url):
+        self._add_fingerprint(self._fingerprint(url))
+
+    def _add_fingerprint(self, fingerprint):
+        with self.lock:
+            table, mask = self._table
+            if self._insert(table, mask, fingerprint):
+                self.count += 1
+                self._record(fingerprint)
+                if self.count * 2 > len(table):
+                    self._grow()
+
+    def _copy_state(self):
+        table, mask = self._table
+        return table.tobytes(), self.count
+
+    def _load_state(self, state):
+        data, self.count = state
+        table = array("Q")
+        table.frombytes(data)
+        self._table = (table, len(table) - 1)
+        self.lock = Lock()
+
+    def _replay(self, fingerprint):
+        self._add_fingerprint(fingerprint)
+
+    def merge(self, other):
+        for fingerprint in other._table[0]:
+            if fingerprint:
+                self._add_fingerprint(fingerprint)
+
+    def __contains__(self, url):
+        fingerprint = self._fingerprint(url)
+        table, mask = self._table
+        i = fingerprint & mask
+        while True:
+            stored = table[i]
+            if stored == fingerprint:
+                return True
+            if stored == 0:
+                return False
+            i = (i + 1) & mask
+
+    def __len__(self):
+        return self.count
+
+
+class BloomSeenSet(Journaled):
+    '''
+    Scalable Bloom filter. Each new stage has twice the capacity and half the
+    false-positive rate of the previous one, so the overall rate stays below
+    `error_rate` however many urls are added. Urls are never reported
+    missing once added, but an unseen url may be reported as seen.
+    '''
+
+    retains_urls = False
+
+    def __init__(self, error_rate=0.001, capacity=1 << 16):
+        self.error_rate = error_rate
+        self.initial_capacity = capacity
+        self.stages = list()
+        self.count = 0
+        self.lock = Lock()
+        self._add_stage()
+
+    def _add_stage(self):
+        index = len(self.stages)
+        capacity = self.initial_capacity << index
+        # Stage error rates form a geometric series summing to error_rate
+        stage_error = self.error_rate * 0.5 ** (index + 1)
+        bits = math.ceil(-capacity * math.log(stage_error) / math.log(2) ** 2)
+        hashes = max(1, math.ceil(-math.log2(stage_error)))
+        self.stages.append([bytearray((bits + 7) // 8), bits, hashes, capacity, 0])
+
+    @staticmethod
+    def _positions(fingerprint, bits, hashes):
+        # Double hashing of the two halves of the fingerprint
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        return ((first + i * second) % bits for i in range(hashes))
+
+    @staticmethod
+    def _stage_contains(stage, fingerprint):
+        array_bits, bits, hashes, _, _ = stage
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        for i in range(hashes):
+            position = (first + i * second) % bits
+            if not array_bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, url):
+        self._add_fingerprint(get_urlhash(url))
+
+    def _add_fingerprint(self, fingerprint):
+        with self.lock:
+            if any(self._stage_contains(stage, fingerprint) for stage in self.stages):
+                return
+            stage = self.stages[-1]
+            array_bits, bits, hashes, _, _ = stage
+            for position in self._positions(fingerprint, bits, hashes):
+                array_bits[position >> 3] |= 1 << (position & 7)
+            stage[4] += 1
+            self.count += 1
+            self._record(fingerprint)
+            if stage[4] >= stage[3]:
+                self._add_stage()
+
+    def _copy_state(self):
+        stages = [[bytearray(stage[0])] + stage[1:] for stage in self.stages]
+        return self.error_rate, self.initial_capacity, stages, self.count
+
+    def _load_state(self, state):
+        self.error_rate, self.initial_capacity, self.stages, self.count = state
+        self.lock = Lock()
+
+    def _replay(self, fingerprint):
+        self._add_fingerprint(fingerprint)
+
+    def merge(self, other):
+        # Stages of different sizes can not be OR-ed together, so the other
+        # filter's stages are kept before our last one, which takes new urls.
+        # The count is exact when the two sets are disjoint, as the shards of
+        # a distributed crawl are.
+        other_stages = [[bytearray(stage[0])] + stage[1:] for stage in other.stages]
+        with self.lock:
+            self.stages[-1:-1] = other_stages
+            self.count += other.count
+
+    def __contains__(self, url):
+        fingerprint = get_urlhash(url)
+        return any(self._stage_contains(stage, fingerprint) for stage in self.stages)
+
+    def __len__(self):
+        return self.count
+
+
+def make_seen_set(mode="exact", error_rate=0.001):
+    if mode == "exact":
+        return ExactSeenSet()
+    if mode == "fingerprint":
+        return FingerprintSeenSet()
+    if mode == "bloom":
+        return BloomSeenSet(error_rate)
+    raise ValueError(f"Unknown seen set mode {mode}")
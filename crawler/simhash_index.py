@@ -0,0 +1,279 @@
+from itertools import combinations
+from math import comb
+from threading import RLock
+
+import numpy as np
+
+from crawler.journal import Journaled
+
+
+fingerprint_bits = 64
+# Most tables choose_blocks will pick, each one holds every fingerprint (8 bytes)
+max_tables = 128
+
+
+if hasattr(int, "bit_count"):
+    def hamming_distance(a, b):
+        return (a ^ b).bit_count()
+else:
+    # int.bit_count is only available on Python 3.10+
+    def hamming_distance(a, b):
+        return bin(a ^ b).count("1")
+
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    # np.bitwise_count is only available on NumPy 2.0+
+    def popcount(values):
+        return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def block_widths(blocks):
+    # Bits in each of `blocks` nearly equal blocks of a fingerprint
+    return [fingerprint_bits // blocks + (1 if i < fingerprint_bits % blocks else 0) for i in range(blocks)]
+
+
+def choose_blocks(max_distance, expected_size):
+    '''
+    Number of blocks for an index expected to hold `expected_size`
+    fingerprints. A lookup probes every table and compares against the
+    fingerprints sharing its key, about expected_size / 2^key bits per
+    table, so keys must grow with the index to keep the candidates few.
+    Picks the count with the least probes plus expected candidates, among
+    those with at most max_tables tables.
+    '''
+    best, best_cost = max_distance + 1, None
+    for blocks in range(max_distance + 1, fingerprint_bits + 1):
+        if comb(blocks, max_distance) > max_tables:
+            break
+        cost = sum(1 + expected_size / 2 ** sum(key)
+                   for key in combinations(block_widths(blocks), blocks - max_distance))
+        if best_cost is None or cost < best_cost:
+            best, best_cost = blocks, cost
+    return best
+
+
+class LinearSimhashIndex(Journaled):
+    ''' Reference index: compares a fingerprint against every stored one. '''
+
+    def __init__(self, max_distance=5):
+        self.max_distance = max_distance
+        self.lock = RLock()
+        self._values = set()
+
+    def add(self, value):
+        with self.lock:
+            if value not in self._values:
+                self._values.add(value)
+                self._record(value)
+
+    def has_near(self, value, distance=None):
+        distance = self.max_distance if distance is None else distance
+        with self.lock:
+            return any(hamming_distance(value, stored) <= distance for stored in self._values)
+
+    def add_if_unique(self, value, distance=None):
+        # Check and insert atomically so two workers can not both accept
+        # the same near-duplicate page.
+        with self.lock:
+            near = self.has_near(value, distance)
+            self.add(value)
+            return not near
+
+    def _copy_state(self):
+        return self.max_distance, set(self._values)
+
+    def _load_state(self, state):
+        max_distance, values = state
+        self.__init__(max_distance)
+        self._values = values
+
+    def _replay(self, value):
+        self.add(value)
+
+    def merge(self, other):
+        for value in other:
+            self.add(value)
+
+    def __contains__(self, value):
+        return value in self._values
+
+    def __iter__(self):
+        return iter(list(self._values))
+
+    def __len__(self):
+        return len(self._values)
+
+
+class PermutedSimhashIndex(LinearSimhashIndex):
+    '''
+    Near-duplicate index over 64-bit Simhash values using permuted tables.
+
+    The fingerprint is split into `blocks` bit blocks. Two fingerprints within
+    `max_distance` bits differ in at most `max_distance` blocks, so they agree
+    exactly on at least `blocks - max_distance` of them. One table is kept per
+    combination of that many blocks: the fingerprints with their bits
+    permuted so those blocks come first, as a sorted row of uint64 values. A
+    lookup permutes the query the same way (which keeps Hamming distances)
+    and only compares against the range sharing its leading bits. The range
+    start of every `prefix_bits` prefix is kept per table, so all tables are
+    searched at once with NumPy instead of a bisection each. More blocks
+    means longer keys (fewer candidates) but more tables, each 9 to 10
+    bytes per fingerprint (8 for the value, 1 or 2 for the prefix starts).
+
+    New fingerprints wait in a buffer of `buffer_size`, compared in full,
+    that is merged into the tables once it fills. With a fixed number of
+    blocks the candidates grow linearly with the stored fingerprints, so
+    give `expected_size` to pick the blocks with choose_blocks. `lookups`
+    and `candidates` (in the tables) count the work of has_near.
+    '''
+
+    def __init__(self, max_distance=5, blocks=None, expected_size=None, buffer_size=4096):
+        self.max_distance = max_distance
+        self.lock = RLock()
+        if blocks is None:
+            blocks = choose_blocks(max_distance, expected_size) if expected_size else max_distance + 2
+        self.blocks = blocks
+        assert self.max_distance < self.blocks <= fingerprint_bits, "Need more blocks than max_distance"
+        self.lookups = 0
+        self.candidates = 0
+
+        # Bit offset and width of each block, lowest first
+        widths = block_widths(self.blocks)
+        offsets = [sum(widths[:i]) for i in range(self.blocks)]
+
+        # Per table: where each block is moved to, key blocks at the top
+        targets, key_bits = list(), list()
+        for key in combinations(range(self.blocks), self.blocks - self.max_distance):
+            order = list(key) + [block for block in range(self.blocks) if block not in key]
+            target, table_targets = fingerprint_bits, [0] * self.blocks
+            for block in order:
+                target -= widths[block]
+                table_targets[block] = target
+            targets.append(table_targets)
+            key_bits.append(sum(widths[block] for block in key))
+        self.sources = np.array(offsets, np.uint64)
+        self.targets = np.array(targets, np.uint64)
+        self.block_masks = np.array([(1 << width) - 1 for width in widths], np.uint64)
+        # Prefixes longer than the shortest key would miss candidates
+        self.max_prefix_bits = min(key_bits)
+        self.rows = np.arange(len(targets))
+
+        # One sorted row per table, and the fingerprints themselves, sorted,
+        # for membership and snapshots
+        self.tables = np.empty((len(targets), 0), np.uint64)
+        self.values = np.empty(0, np.uint64)
+        self.prefix_bits = 0
+        self.starts = np.zeros((len(targets), 2), np.int32)
+        self.buffer = np.empty(buffer_size, np.uint64)
+        self.buffered = 0
+
+    def _permute(self, values):
+        # `values` with the bits permuted for every table, one row per table
+        shifted = (values[:, None] >> self.sources) & self.block_masks
+        return np.bitwise_or.reduce(shifted[None, :, :] << self.targets[:, None, :], axis=2)
+
+    def _prefixes(self, permuted):
+        return (permuted >> np.uint64(fingerprint_bits - self.prefix_bits)).astype(np.intp)
+
+    def _index_prefixes(self):
+        # Start of every prefix in each table, and the end of the last one
+        size = self.tables.shape[1]
+        self.prefix_bits = min(max(size.bit_length() - 2, 1), self.max_prefix_bits)
+        self.starts = np.zeros((len(self.rows), (1 << self.prefix_bits) + 1), np.int32)
+        for row, table in enumerate(self.tables):
+            np.cumsum(np.bincount(self._prefixes(table), minlength=1 << self.prefix_bits),
+                      out=self.starts[row, 1:])
+
+    def _merge_buffer(self):
+        # Must be called with the lock held.
+        new = np.sort(self.buffer[:self.buffered])
+        self.buffered = 0
+        self.values = np.insert(self.values, np.searchsorted(self.values, new), new)
+        permuted = np.sort(self._permute(new), axis=1)
+        tables = np.empty((len(self.rows), self.tables.shape[1] + len(new)), np.uint64)
+        for row in self.rows:
+            table = self.tables[row]
+            tables[row] = np.insert(table, np.searchsorted(table, permuted[row]), permuted[row])
+        self.tables = tables
+        if self.prefix_bits == min(max(tables.shape[1].bit_length() - 2, 1), self.max_prefix_bits):
+            # Same prefix length, only shift the starts after the new values
+            for row in self.rows:
+                counts = np.bincount(self._prefixes(permuted[row]), minlength=1 << self.prefix_bits)
+                self.starts[row, 1:] += np.cumsum(counts)
+        else:
+            self._index_prefixes()
+
+    def _contains(self, value):
+        # Must be called with the lock held.
+        value = np.uint64(value)
+        index = int(np.searchsorted(self.values, value))
+        return ((index < len(self.values) and self.values[index] == value) or
+                bool((self.buffer[:self.buffered] == value).any()))
+
+    def add(self, value):
+        with self.lock:
+            if self._contains(value):
+                return
+            self.buffer[self.buffered] = value
+            self.buffered += 1
+            self._record(value)
+            if self.buffered == len(self.buffer):
+                self._merge_buffer()
+
+    def _copy_state(self):
+        # Only the fingerprints are saved, the tables are rebuilt on load
+        return self.max_distance, np.concatenate((self.values, self.buffer[:self.buffered])), self.blocks
+
+    def _load_state(self, state):
+        # The fingerprints are a set in checkpoints of older versions
+        max_distance, values, blocks = state
+        self.__init__(max_distance, blocks)
+        self.values = np.unique(np.fromiter(values, np.uint64, len(values)))
+        self.tables = np.sort(self._permute(self.values), axis=1)
+        self._index_prefixes()
+
+    def has_near(self, value, distance=None):
+        distance = self.max_distance if distance is None else distance
+        assert distance <= self.max_distance, f"Index only supports distances up to {self.max_distance}"
+        with self.lock:
+            self.lookups += 1
+            value = np.uint64(value)
+            if self.buffered and (popcount(self.buffer[:self.buffered] ^ value) <= distance).any():
+                return True
+            if not len(self.values):
+                return False
+            # The range sharing the query's prefix in each table, gathered
+            # into one array of candidates
+            queries = self._permute(value.reshape(1))[:, 0]
+            prefixes = self._prefixes(queries)
+            first = self.starts[self.rows, prefixes]
+            counts = self.starts[self.rows, prefixes + 1] - first
+            total = int(counts.sum())
+            if not total:
+                return False
+            self.candidates += total
+            rows = np.repeat(self.rows, counts)
+            columns = np.arange(total) + np.repeat(first - (np.cumsum(counts) - counts), counts)
+            return bool((popcount(self.tables[rows, columns] ^ queries[rows]) <= distance).any())
+
+    def merge(self, other):
+        with self.lock:
+            for value in other:
+                self.add(value)
+
+    def __contains__(self, value):
+        with self.lock:
+            return self._contains(value)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(self.values.tolist() + self.buffer[:self.buffered].tolist())
+
+    def __len__(self):
+        return len(self.values) + self.buffered
+
+    def memory_bytes(self):
+        # Bytes held by the arrays, the tables take 8 per fingerprint each
+        return self.tables.nbytes + self.starts.nbytes + self.values.nbytes + self.buffer.nbytes
@@ -0,0 +1,59 @@
+import zlib
+
+import numpy as np
+
+from crawler.token_stats import count_tokens
+
+
+simhash_bits = 64
+# Column i of a fingerprint's unpacked bits is bit i of the value
+bit_values = np.left_shift(np.uint64(1), np.arange(simhash_bits, dtype=np.uint64))
+
+
+def splitmix64(values):
+    # Spreads 32-bit hashes over 64 bits, elementwise on a uint64 array.
+    # NumPy multiplies uint64 modulo 2^64, as splitmix64 expects.
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def token_hashes(tokens):
+    # 64-bit hash of each token: crc32 in C, then splitmix64 on the whole array
+    crcs = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), np.uint64, len(tokens))
+    return splitmix64(crcs)
+
+
+def simhashes(counts_list):
+    '''
+    64-bit simhash of each page from its token counts, every token weighted
+    by its count. Bit i of a fingerprint is set when the tokens whose hash
+    has bit i set carry more than half of the page's weight. The hashes of
+    all pages are unpacked to bits at once and summed per page with
+    np.add.reduceat. Pages without tokens get 0.
+    '''
+    fingerprints = [0] * len(counts_list)
+    pages = [i for i, counts in enumerate(counts_list) if counts]
+    if not pages:
+        return fingerprints
+    tokens = [token for i in pages for token in counts_list[i]]
+    weights = np.fromiter((count for i in pages for count in counts_list[i].values()), np.int64, len(tokens))
+    starts = np.cumsum([0] + [len(counts_list[i]) for i in pages[:-1]])
+
+    # One row of 64 bits per token
+    bits = np.unpackbits(token_hashes(tokens).view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    weight_ones = np.add.reduceat(bits * weights[:, None], starts, axis=0)
+    totals = np.add.reduceat(weights, starts)
+    values = np.bitwise_or.reduce(
+        np.where(2 * weight_ones > totals[:, None], bit_values, np.uint64(0)), axis=1)
+    for i, value in zip(pages, values.tolist()):
+        fingerprints[i] = value
+    return fingerprints
+
+
+def text_features(texts):
+    # (token counts, token total, simhash) of each text, tokenized once for both
+    tokenized = [count_tokens(text) for text in texts]
+    fingerprints = simhashes([counts for counts, _ in tokenized])
+    return [(counts, total, fingerprint) for (counts, total), fingerprint in zip(tokenized, fingerprints)]
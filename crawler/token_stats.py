@@ -0,0 +1,212 @@
+import heapq
+import os
+import re
+import shutil
+import zlib
+from collections import Counter
+from contextlib import ExitStack
+from itertools import chain
+from operator import itemgetter, methodcaller
+from threading import Lock
+
+
+min_token_length = 3
+# A token is a maximal run of these characters, so requiring the minimum
+# length in the pattern skips short tokens without a length check
+token_pattern = re.compile(rf"[a-zA-Z0-9']{{{min_token_length},}}")
+
+
+def count_tokens(text):
+    # Counts tokens while iterating the regex matches, the token list is never built.
+    counts = Counter(map(methodcaller("group"), token_pattern.finditer(text.lower())))
+    return counts, sum(counts.values())
+
+
+class TokenStats(object):
+    '''
+    Token counts of the whole crawl, sharded by a stable hash of the token.
+
+    Each shard has its own lock, so workers merging pages rarely contend.
+    Once more than `spill_threshold` distinct tokens are held in memory,
+    every shard is appended to a spill file in `spill_dir` and cleared.
+    A token always lands in the same shard, so the top-K report merges one
+    shard at a time with its spill files and only ever holds one shard's
+    vocabulary.
+
+    When journaling is started, every shard also keeps the counts added
+    since the last drain, so a checkpoint only writes those deltas.
+    '''
+
+    def __init__(self, shards=16, spill_threshold=2_000_000, spill_dir="data/token_spill"):
+        self.shards = [Counter() for _ in range(shards)]
+        self.locks = [Lock() for _ in range(shards)]
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.spill_files = [list() for _ in range(shards)]
+        self.spill_lock = Lock()
+        self.spill_count = 0
+        self.deltas = None
+
+    def shard_of(self, token):
+        # crc32 rather than hash() so shards match across processes and runs
+        return zlib.crc32(token.encode("utf-8")) % len(self.shards)
+
+    def add_text(self, text):
+        counts, total = count_tokens(text)
+        self.update(counts)
+        return total
+
+    def update(self, counts):
+        grouped = [list() for _ in self.shards]
+        for token, count in counts.items():
+            grouped[self.shard_of(token)].append((token, count))
+        for index, items in enumerate(grouped):
+            if not items:
+                continue
+            with self.locks[index]:
+                shard = self.shards[index]
+                for token, count in items:
+                    shard[token] = shard.get(token, 0) + count
+                if self.deltas is not None:
+                    delta = self.deltas[index]
+                    for token, count in items:
+                        delta[token] = delta.get(token, 0) + count
+        if self.memory_size() > self.spill_threshold:
+            self.spill()
+
+    def memory_size(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def spill(self):
+        with self.spill_lock:
+            if self.memory_size() <= self.spill_threshold:
+                # Another worker spilled already
+                return
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.spill_count += 1
+            for index, lock in enumerate(self.locks):
+                # The file is written under the shard lock so a snapshot
+                # never sees the shard cleared before its spill file is listed
+                with lock:
+                    shard, self.shards[index] = self.shards[index], Counter()
+                    if not shard:
+                        continue
+                    path = os.path.join(self.spill_dir, f"{os.getpid()}-{self.spill_count:05d}-{index:03d}.tsv")
+                    with open(path, "w") as f:
+                        f.writelines(f"{token}\t{count}\n" for token, count in shard.items())
+                    self.spill_files[index].append(path)
+
+    def shard_counts(self, index):
+        # Full counts of one shard: its memory part plus its spill files.
+        with self.locks[index]:
+            counts = Counter(self.shards[index])
+        for path in self.spill_files[index]:
+            with open(path) as f:
+                for line in f:
+                    token, count = line.rstrip("\n").split("\t")
+                    counts[token] += int(count)
+        return counts
+
+    def items(self):
+        for index in range(len(self.shards)):
+            yield from self.shard_counts(index).items()
+
+    def most_common(self, k, exclude=()):
+        # Top k of each shard with a heap, then the top k of those.
+        candidates = chain.from_iterable(
+            heapq.nlargest(k, ((token, count) for token, count in self.shard_counts(index).items()
+                               if token not in exclude), key=itemgetter(1))
+            for index in range(len(self.shards)))
+        return heapq.nlargest(k, candidates, key=itemgetter(1))
+
+    def start_journal(self):
+        with ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            self.deltas = [Counter() for _ in self.shards]
+
+    def drain_journal(self):
+        # Counts added since the last drain, one shard at a time
+        if self.deltas is None:
+            return list()
+        drained = list()
+        for index, lock in enumerate(self.locks):
+            with lock:
+                delta, self.deltas[index] = self.deltas[index], Counter()
+            if delta:
+                drained.append(delta)
+        return drained
+
+    def restore_journal(self, deltas):
+        # Puts back counts drained for a delta that could not be written
+        if self.deltas is None:
+            return
+        for delta in deltas:
+            grouped = [list() for _ in self.shards]
+            for token, count in delta.items():
+                grouped[self.shard_of(token)].append((token, count))
+            for index, items in enumerate(grouped):
+                with self.locks[index]:
+                    shard_delta = self.deltas[index]
+                    for token, count in items:
+                        shard_delta[token] = shard_delta.get(token, 0) + count
+
+    def replay(self, deltas):
+        for delta in deltas:
+            self.update(delta)
+
+    def merge(self, other):
+        # One shard of the other counts in memory at a time. The other
+        # counts are consumed, their spill files are removed once merged.
+        for index in range(len(other.shards)):
+            self.update(other.shard_counts(index))
+            other.remove_spill_files(index)
+
+    def remove_spill_files(self, index):
+        with self.locks[index]:
+            files, self.spill_files[index] = self.spill_files[index], list()
+        for path in files:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear_spill_dir(self):
+        # Spill files of earlier runs, removed when the crawl restarts
+        if os.path.exists(self.spill_dir):
+            shutil.rmtree(self.spill_dir)
+
+    def _copy_state(self):
+        # Must be called with every shard lock held.
+        return {
+            "shards": [Counter(shard) for shard in self.shards],
+            "spill_files": [list(files) for files in self.spill_files],
+            "spill_threshold": self.spill_threshold,
+            "spill_dir": self.spill_dir,
+            "spill_count": self.spill_count,
+        }
+
+    def snapshot(self):
+        # All shard locks are held so the copy and the delta reset are one step
+        with ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            state = self._copy_state()
+            if self.deltas is not None:
+                self.deltas = [Counter() for _ in self.shards]
+            return state
+
+    def copy(self):
+        # Consistent copy of the counts at one instant, the journal is left alone
+        with ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            state = self._copy_state()
+        return TokenStats.from_snapshot(state)
+
+    @classmethod
+    def from_snapshot(cls, state):
+        stats = cls(len(state["shards"]), state["spill_threshold"], state["spill_dir"])
+        stats.shards = state["shards"]
+        # Spill files of the previous run are still counted if they survived
+        stats.spill_files = [[path for path in files if os.path.exists(path)] for files in state["spill_files"]]
+        stats.spill_count = state["spill_count"]
+        return stats
@@ -1,17 +1,28 @@
+import time
+
 from threading import Thread
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
+from crawler.parse_pool import get_parse
+from crawler.page_cache import get_page_cache
 import scraper
-import time
 
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
-        self.logger = get_logger(f"Worker-{worker_id}", "Worker")
+        self.logger = get_logger(f"Worker-{worker_id}", "Worker", sampled=True)
         self.config = config
         self.frontier = frontier
+        self.parse = get_parse(config)
+        self.page_cache = get_page_cache(config)
+        self.archive = None
+        if config.archive_dir:
+            # Imported here so the archive is only loaded with ARCHIVE_DIR set
+            from crawler.page_archive import get_archive
+            self.archive = get_archive(config)
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
@@ -23,12 +34,26 @@ class Worker(Thread):
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+            resp, elapsed = None, None
+            try:
+                start = time.perf_counter()
+                with metrics.timer("download"):
+                    headers = self.page_cache.conditional_headers(tbd_url) if self.page_cache else None
+                    resp = download(tbd_url, self.config, self.logger, headers)
+                elapsed = time.perf_counter() - start
+                metrics.inc("downloads", status=resp.status)
+                # Formatted on the log thread, and only if the line is sampled
+                self.logger.info(
+                    "Downloaded %s, status <%s>, using cache %s.",
+                    tbd_url, resp.status, self.config.cache_server)
+                scraped_urls = scraper.scraper(tbd_url, resp, self.parse, self.frontier.owns, self.page_cache)
+                for scraped_url in scraped_urls:
+                    self.frontier.add_url(scraped_url)
+                if self.archive is not None:
+                    self.archive.add(tbd_url, resp)
+            except Exception as e:
+                metrics.inc("crawl_errors")
+                self.logger.error(f"Failed to crawl {tbd_url}: {e}")
+            # The frontier applies the politeness delay per host, adapted to
+            # this download, so the worker can move on to another host right away.
+            self.frontier.mark_url_complete(tbd_url, resp, elapsed)
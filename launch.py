@@ -5,14 +5,56 @@ from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
 from crawler.database import Database as db
+from crawler.checkpoint import start_checkpointer
+from crawler.report import ReportWriter
+from crawler.page_cache import close_page_cache
+from crawler.parse_pool import close_parse
+from utils.metrics import metrics
+from utils.replay import ResponseCorpus, ReplayServer
+from utils import configure_logging
 
-def main(config_file, restart):
+def main(config_file, restart, nodes=1):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
+    configure_logging(config)
+    if config.replay_dir:
+        # Crawl offline from recorded responses
+        replay_server = ReplayServer(ResponseCorpus(config.replay_dir), config.replay_latency)
+        config.cache_server = replay_server.start()
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    db.configure(config)
+    if nodes > 1:
+        # Each node process checkpoints and reports its own metrics
+        from crawler.distributed import run_distributed
+        run_distributed(config, restart, nodes)
+        db.write_all()
+        return
+    checkpointer = start_checkpointer(config, restart)
+    metrics.configure(config)
+    metrics.start()
+    report_writer = ReportWriter(config)
+    report_writer.start()
+    try:
+        if config.engine == "async":
+            # Imported here so aiohttp is only needed by the async engine
+            from crawler.async_worker import AsyncCrawler
+            crawler = AsyncCrawler(config, restart)
+        else:
+            crawler = Crawler(config, restart)
+        checkpointer.track(crawler.frontier)
+        crawler.start()
+    finally:
+        report_writer.stop()
+        checkpointer.stop()
+        metrics.stop()
+        close_parse()
+        close_page_cache()
+        if config.archive_dir:
+            # Imported here so the archive is only loaded with ARCHIVE_DIR set
+            from crawler.page_archive import close_archive
+            close_archive()
     db.write_all()
 
 
@@ -20,5 +62,6 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--nodes", type=int, default=1, help="crawler processes, hosts are split between them")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.nodes)
@@ -0,0 +1,87 @@
+from configparser import ConfigParser
+from argparse import ArgumentParser
+from collections import deque
+from itertools import islice
+import time
+
+from utils import get_logger, configure_logging
+from utils.config import Config
+from crawler.database import Database as db
+from crawler.page_archive import ArchiveReader, archive_directories
+from crawler.parse_pool import ParsePool
+import scraper
+
+
+def parsed_batches(pages, batch_size, pool, window):
+    # (batch, parsed pages) in archive order. With a pool, up to `window`
+    # batches are parsed ahead while the caller merges the current one.
+    pending = deque()
+    while True:
+        batch = list(islice(pages, batch_size))
+        if not batch:
+            break
+        contents = [page.content for page in batch]
+        base_urls = [page.url or page.requested_url for page in batch]
+        if pool is None:
+            yield batch, scraper.parse_pages(contents, base_urls)
+            continue
+        pending.append((batch, pool.parse_batch(contents, base_urls)))
+        if len(pending) >= window:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+    while pending:
+        batch, future = pending.popleft()
+        yield batch, future.result()
+
+
+def main(config_file, archive_dir, batch_size):
+    # Rebuilds the reports in data/ from the page archive, without the cache
+    # server. Pages are parsed in the parse processes, and merged into the
+    # Database in the order they were archived, as the crawl would have.
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    configure_logging(config)
+    logger = get_logger("REANALYZE")
+    db.configure(config)
+    directories = archive_directories(archive_dir or config.archive_dir)
+    if not directories:
+        logger.error(f"No page archive in {archive_dir or config.archive_dir!r}, set ARCHIVE_DIR and crawl first.")
+        return
+
+    pool = ParsePool(config.parse_processes) if config.parse_processes > 0 else None
+    start = time.perf_counter()
+    count = 0
+    # Merges run in this process one page at a time, whatever PARSE_PROCESSES
+    merge_time = 0.0
+    try:
+        for directory in directories:
+            reader = ArchiveReader(directory)
+            logger.info(f"Reanalyzing {len(reader)} pages from {directory}")
+            try:
+                for batch, parsed in parsed_batches(iter(reader), batch_size, pool, 2 * max(1, config.parse_processes)):
+                    merge_start = time.perf_counter()
+                    for page, parsed_page in zip(batch, parsed):
+                        # The page is already parsed, the scraper only merges it
+                        scraper.scraper(page.requested_url, page, lambda content, base_url: parsed_page)
+                    merge_time += time.perf_counter() - merge_start
+                    count += len(batch)
+            finally:
+                reader.close()
+    finally:
+        if pool is not None:
+            pool.close()
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Reanalyzed {count} pages in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} pages/s), "
+        f"{merge_time:.1f}s of it merging ({count / max(merge_time, 1e-9):.1f} pages/s at most with any parse pool)")
+    db.write_all()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--archive_dir", type=str, default="", help="defaults to ARCHIVE_DIR of the config")
+    parser.add_argument("--batch_size", type=int, default=32, help="pages sent to a parse process at once")
+    args = parser.parse_args()
+    main(args.config_file, args.archive_dir, args.batch_size)
@@ -1,8 +1,14 @@
 import re
-from urllib.parse import urlparse, urlunparse
+from collections import namedtuple
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup, Comment
 from crawler.database import Database as db
 from simhash import Simhash
+from utils.fast_extract import extract_text_and_links as fast_extract_text_and_links
+from utils.url_filter import UrlFilter
+from utils.trap_detector import TrapDetector
+from utils.url_canon import canonicalize
+from utils.metrics import metrics
 
 # @TODO Remove after test phase
 # import time
@@ -10,85 +16,134 @@ from simhash import Simhash
 
 lower_bound = 2500
 simhash_threshold = 5
+# Page text and link extraction: "bs4" builds a BeautifulSoup tree, "lxml"
+# streams the page through utils.fast_extract in one pass without a tree
+extractor_engine = "bs4"
+# Simhash and token counts: "simhash" hashes character shingles with the
+# simhash package and tokenizes separately, "numpy" tokenizes once and
+# hashes the token counts with crawler.text_features, a batch at a time.
+# The fingerprints differ, so keep one engine for a whole crawl.
+text_features_engine = "simhash"
 # page_limit = 5
 space_delim_re = re.compile(r"\s+")
 normalize_re = re.compile(r"\s+([?.!])")
-date_in_path_re = re.compile(r"(\d{4})(?:[/-](\d{1,2})(?:[/-](\d{1,2}))?)?")
-date_in_query_re = re.compile(r"(\d{4})((?:-\d{1,2})?)((?:-\d{1,2})?)?")
+# Calendars and pagination are caught by the trap detector now
+# date_in_path_re = re.compile(r"(\d{4})(?:[/-](\d{1,2})(?:[/-](\d{1,2}))?)?")
+# date_in_query_re = re.compile(r"(\d{4})((?:-\d{1,2})?)((?:-\d{1,2})?)?")
 # pagination_re = re.compile(r"/page/(\d+)?")
-invalid_url_ext_re = re.compile(r".*\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|mid|mp2|mp3|mp4|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1|thmx|mso|arff|rtf|jar|csv|rm|smil|wmv|swf|wma|zip|rar|gz)$", re.IGNORECASE)
+invalid_url_exts = {
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico", "png", "tif", "tiff", "mid", "mp2", "mp3", "mp4", "wav",
+    "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg", "ogv", "pdf", "ps", "eps", "tex", "ppt", "pptx", "doc",
+    "docx", "xls", "xlsx", "names", "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z", "psd", "dmg", "iso",
+    "epub", "dll", "cnf", "tgz", "sha1", "thmx", "mso", "arff", "rtf", "jar", "csv", "rm", "smil", "wmv", "swf",
+    "wma", "zip", "rar", "gz"
+}
 
 
-def scraper(url, resp):
-    links = extract_next_links(url, resp)
+def scraper(url, resp, parse=None, owns=None, page_cache=None):
+    links = extract_next_links(url, resp, parse, page_cache)
+    if owns is not None:
+        # Distributed crawl: urls owned by other nodes are validated there
+        links = list(dict.fromkeys(links))
+        return filter_urls([link for link in links if owns(link)]) + [link for link in links if not owns(link)]
     # @TODO Remove after test phase
     # start = time.time()
-    valid_links = [link for link in links if is_valid(link)]
+    valid_links = filter_urls(links)
     # run_time = time.time() - start
     # print(f"is_valid runtime: {run_time:.4f} seconds")
     return valid_links
 
 
-def extract_next_links(url, resp):
+def filter_urls(urls):
+    # Pages often link to the same url many times, check each one once.
+    valid = metrics.timed("is_valid", is_valid) if metrics.enabled else is_valid
+    return [url for url in dict.fromkeys(urls) if valid(url)]
+
+
+def extract_next_links(url, resp, parse=None, page_cache=None):
     # Implementation required.
     # url: the URL that was used to get the page
     # resp.url: the actual url of the page
     # resp.status: the status code returned by the server. 200 is OK, you got the page. Other numbers mean that there was some kind of problem.
     # resp.error: when status is not 200, you can check the error here, if needed.
-    # resp.raw_response: this is where the page actually is. More specifically, the raw_response has two parts:
-    #         resp.raw_response.url: the url, again
-    #         resp.raw_response.content: the content of the page!
-    # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
+    # resp.content: this is where the page actually is, decoded the first time it is read.
+    # resp.headers: the response headers, with lowercase names.
+    # resp.raw_response: the url again and the content, kept for older code.
+    # Return a list with the hyperlinks (as strings) scrapped from resp.content
+    # parse: optional callable that runs parse_page elsewhere, e.g. in a parse process
+    # page_cache: optional crawler.page_cache.PageCache of pages parsed before
 
-    # Skip page if it's already scraped or an invalid URL
-    if resp.status != 200 or url in db.visited_urls or url in db.invalid_urls:
+    # Skip page if it's already scraped or an invalid URL. A 304 only
+    # answers the conditional request sent for a cached page.
+    status_ok = resp.status == 200 or (resp.status == 304 and page_cache is not None)
+    if not status_ok or url in db.visited_urls or url in db.invalid_urls:
+        metrics.inc("rejected_pages", reason="status" if not status_ok else "seen")
         db.invalid_urls.add(url)
         return list()
+
+    # Reuse the page parsed in an earlier crawl if it did not change
+    if page_cache is not None:
+        page = page_cache.lookup(url, resp)
+        if page is not None:
+            return merge_page(url, page)
+        if resp.status == 304:
+            # Evicted since the request was sent
+            metrics.inc("rejected_pages", reason="status")
+            db.invalid_urls.add(url)
+            return list()
     
     # Skip page if it's empty
-    if not resp.raw_response or not resp.raw_response.content:
+    if not resp.content:
+        metrics.inc("rejected_pages", reason="empty")
         db.invalid_urls.add(url)
         return list()
-    
-    try:
-        soup = BeautifulSoup(resp.raw_response.content, "lxml")
-    except Exception as e:
-        print(e)
+
+    with metrics.timer("parse"):
+        page = (parse or parse_page)(resp.content, resp.url or url)
+    if page is None:
+        metrics.inc("rejected_pages", reason="parse_error")
         db.invalid_urls.add(url)
         return list()
-    
+
+    if page_cache is not None:
+        page_cache.store(url, resp, page)
+    return merge_page(url, page)
+
+
+# Compact result of parse_page, cheap to send back from a parse process
+ParsedPage = namedtuple("ParsedPage", ["links", "token_counts", "token_count", "simhash", "text_length"])
+
+
+def extract_text_and_links(content):
+    soup = BeautifulSoup(content, "lxml")
+
     # Remove HTML comments
     for comment in soup(text=lambda text: isinstance(text, Comment)):
         comment.extract()
 
     # Remove HTML tags
     web_text = soup.get_text(separator=" ", strip=True)
+    hrefs = [href for link in soup.find_all('a') if (href := link.get('href'))]
+    return web_text, hrefs
+
+
+def extract_page(content, base_url=None):
+    # Normalized text and canonical links of a page, or None if it can not be parsed.
+    # Relative links are resolved against base_url.
+    try:
+        if extractor_engine == "lxml":
+            web_text, hrefs = fast_extract_text_and_links(content)
+        else:
+            web_text, hrefs = extract_text_and_links(content)
+    except Exception as e:
+        print(e)
+        return None
+
     # Replace multiple spaces with a single space
     space_delim_text = space_delim_re.sub(" ", web_text)
     # Normalize text
     normalized_text = normalize_re.sub(r"\1", space_delim_text)
 
-    # Skip page if it has high similarity to other pages
-    sim_hash = Simhash(normalized_text)
-    if any(abs(hash - sim_hash.value) <= simhash_threshold for hash in db.content_hash):
-        db.content_hash.add(sim_hash.value)
-        db.invalid_urls.add(url)
-        return list()
-    
-    db.content_hash.add(sim_hash.value)
-
-    # Skip page if the text is too short
-    if len(normalized_text) < lower_bound:
-        db.invalid_urls.add(url)
-        return list()
-    
-    # Tokenize text and save to database
-    # @TODO Remove after test phase
-    # start = time.time()
-    db.tokenize(url, normalized_text)
-    # run_time = time.time() - start
-    # print(f"tokenize runtime: {run_time:.4f} seconds")
-
     # clean_links = set()
 
     # for link in soup.find_all('a'):
@@ -100,15 +155,88 @@ def extract_next_links(url, resp):
     #         )
     #         clean_links.add(link_with_no_frag)
 
-    # Extract links and remove fragments
-    clean_links = {
-        urlunparse(urlparse(href)._replace(fragment=""))  # Remove fragment
-        for link in soup.find_all('a')
-        if (href := link.get('href'))
-    }
+    # Resolve links against the page url and canonicalize them
+    clean_links = set()
+    for href in hrefs:
+        try:
+            clean_links.add(canonicalize(href, base_url))
+        except ValueError:
+            continue
+
+    return normalized_text, list(clean_links)
+
+
+def parse_page(content, base_url=None):
+    # Parse a page without touching the Database so it can run in another process.
+    if text_features_engine == "numpy":
+        return parse_pages([content], [base_url])[0]
+    extracted = extract_page(content, base_url)
+    if extracted is None:
+        return None
+    normalized_text, links = extracted
+
+    # These two timers only record in the crawler process, not in a parse process
+    with metrics.timer("simhash"):
+        sim_hash = Simhash(normalized_text)
+
+    # Only pages long enough to be kept are tokenized
+    token_counts, token_count = None, 0
+    if len(normalized_text) >= lower_bound:
+        with metrics.timer("tokenize"):
+            token_counts, token_count = db.count_tokens(normalized_text)
+
+    return ParsedPage(links, token_counts, token_count, sim_hash.value, len(normalized_text))
+
+
+def parse_pages(contents, base_urls=None):
+    # parse_page for a batch of pages, None for each page that can not be
+    # parsed. The numpy engine computes the features of the whole batch at once.
+    if base_urls is None:
+        base_urls = [None] * len(contents)
+    if text_features_engine != "numpy":
+        return [parse_page(content, base_url) for content, base_url in zip(contents, base_urls)]
+    # Imported here so text_features is only loaded by the numpy engine
+    from crawler.text_features import text_features
+    extracted = [extract_page(content, base_url) for content, base_url in zip(contents, base_urls)]
+    with metrics.timer("features"):
+        features = iter(text_features([page[0] for page in extracted if page is not None]))
+    pages = list()
+    for page in extracted:
+        if page is None:
+            pages.append(None)
+            continue
+        normalized_text, links = page
+        token_counts, token_count, fingerprint = next(features)
+        # Only pages long enough to be kept count towards the tokens
+        if len(normalized_text) < lower_bound:
+            token_counts, token_count = None, 0
+        pages.append(ParsedPage(links, token_counts, token_count, fingerprint, len(normalized_text)))
+    return pages
+
+
+def merge_page(url, page):
+    # Skip page if it is within simhash_threshold bits of another page
+    if not db.content_hash.add_if_unique(page.simhash, simhash_threshold):
+        metrics.inc("rejected_pages", reason="near_duplicate")
+        db.invalid_urls.add(url)
+        return list()
+
+    # Skip page if the text is too short
+    if page.text_length < lower_bound:
+        metrics.inc("rejected_pages", reason="too_short")
+        db.invalid_urls.add(url)
+        return list()
+    
+    # Save tokens to database
+    # @TODO Remove after test phase
+    # start = time.time()
+    db.add_tokens(url, page.token_counts, page.token_count)
+    # run_time = time.time() - start
+    # print(f"tokenize runtime: {run_time:.4f} seconds")
 
     db.visited_urls.add(url)
-    return list(clean_links)
+    metrics.inc("pages_kept")
+    return page.links
 
 
 allowed_domains = {
@@ -121,15 +249,28 @@ allowed_domains = {
 specific_domain = "today.uci.edu"
 specific_path = "/department/information_computer_sciences"
 
+# Fragments are already removed when links are canonicalized, and filter
+# or date urls are left to the trap detector
 trap_urls = {
-    "?share=",
     "pdf",
-    "redirect",
-    "#comment",
-    "#comments",
-    "#respond"
+    "redirect"
+}
+# Query parameters matched by name, canonicalize sorts the query so a
+# substring like "?share=" would miss them after the first parameter
+trap_params = {
+    "share"
 }
 
+# Compiled once at import, is_valid runs for every outlink
+url_filter = UrlFilter(
+    allowed_domains, specific_domain, specific_path, trap_urls, invalid_url_exts, trap_params=trap_params)
+
+# Most new urls accepted per url template, e.g. www.ics.uci.edu/events/#-#-#?
+trap_template_cap = 200
+trap_max_depth = 10
+trap_max_repeats = 2
+trap_detector = TrapDetector(trap_template_cap, trap_max_depth, trap_max_repeats)
+
 
 def is_valid(url):
     # Decide whether to crawl this url or not. 
@@ -139,18 +280,11 @@ def is_valid(url):
     try:
         parsed = urlparse(url)
 
-        if (parsed.scheme not in {"http", "https"} or
-            not any(parsed.netloc == domain or parsed.netloc.endswith("." + domain) for domain in allowed_domains) and
-            not (parsed.netloc == specific_domain or parsed.path.startswith(specific_path)) or
-            url in db.invalid_urls or
-            url in db.visited_urls or
-            any(trap in url for trap in trap_urls) or
-            invalid_url_ext_re.match(parsed.path.lower()) or
-            "filter" in url or
-            # Invalid if a link contains date
-            date_in_path_re.search(parsed.path) or
-            date_in_query_re.search(parsed.query)):
-
+        reason = ("invalid" if url in db.invalid_urls else
+                  "visited" if url in db.visited_urls else
+                  url_filter.rejection_reason(url, parsed))
+        if reason:
+            metrics.inc("rejected_urls", reason=reason)
             db.invalid_urls.add(url)
             return False
         # if parsed.scheme not in set(["http", "https"]):
@@ -178,14 +312,34 @@ def is_valid(url):
         #     if page_num > page_limit:
         #         return False
             
-        # Track subdomains within `uci.edu` domain
-        if parsed.netloc.endswith("uci.edu"):
-            db.subdomains[parsed.netloc.lower().strip()] = db.subdomains.get(parsed.netloc.lower().strip(), 0) + 1
-        
-        db.unique_urls.add(url)
+        with db.lock:
+            # Only a newly found url counts towards its subdomain and template
+            if url in db.unique_urls:
+                return True
+            reason = trap_detector.rejection_reason(parsed)
+            if reason:
+                metrics.inc("rejected_urls", reason=f"trap_{reason}")
+                db.invalid_urls.add(url)
+                return False
+            db.unique_urls.add(url)
+            # Track subdomains within `uci.edu` domain
+            if parsed.netloc.endswith("uci.edu"):
+                db.subdomains[parsed.netloc.lower().strip()] = db.subdomains.get(parsed.netloc.lower().strip(), 0) + 1
         return True
 
     except TypeError:
         print ("TypeError for ", parsed)
         # raise
         return False
+
+
+def is_still_valid(url):
+    # Check a url again before it is downloaded, e.g. one resumed from the
+    # save file. Unlike is_valid it records nothing, the url was counted
+    # when it was first found.
+    try:
+        return not (url in db.invalid_urls or
+                    url in db.visited_urls or
+                    url_filter.rejection_reason(url, urlparse(url)))
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,44 @@
+import aiohttp
+import cbor
+
+from utils.response import Response
+from utils.replay import get_recorder
+
+
+class AsyncDownloader(object):
+    ''' Downloads through the cache server over one keep-alive connection pool. '''
+
+    def __init__(self, config, logger=None):
+        self.config = config
+        self.logger = logger
+        self.session = None
+
+    async def open(self):
+        connector = aiohttp.TCPConnector(limit=self.config.concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.config.download_timeout))
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def download(self, url, headers=None):
+        host, port = self.config.cache_server
+        async with self.session.get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{self.config.user_agent}")], headers=headers) as resp:
+            content = await resp.read()
+            status = resp.status
+        if self.config.record_dir:
+            get_recorder(self.config.record_dir).record(url, status, content)
+        try:
+            if content:
+                return Response(cbor.loads(content))
+        except (EOFError, ValueError) as e:
+            pass
+        if self.logger:
+            self.logger.error(f"Spacetime Response error {status} with url {url}.")
+        return Response({
+            "error": f"Spacetime Response error {status} with url {url}.",
+            "status": status,
+            "url": url})
@@ -8,12 +8,63 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.concurrency = int(config["LOCAL PROPERTIES"].get("CONCURRENCY", "100"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSE_PROCESSES", "0"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.save_backend = config["LOCAL PROPERTIES"].get("SAVE_BACKEND", "shelve").strip().lower()
+        self.save_batch_size = int(config["LOCAL PROPERTIES"].get("SAVE_BATCH_SIZE", "500"))
+        # In milliseconds in config.ini
+        self.save_flush_interval = float(config["LOCAL PROPERTIES"].get("SAVE_FLUSH_INTERVAL", "500")) / 1000
+        self.seen_set = config["LOCAL PROPERTIES"].get("SEEN_SET", "exact").strip().lower()
+        self.seen_set_error_rate = float(config["LOCAL PROPERTIES"].get("SEEN_SET_ERROR_RATE", "0.001"))
+        self.simhash_index_size = int(config["LOCAL PROPERTIES"].get("SIMHASH_INDEX_SIZE", "100000"))
+        self.token_spill_threshold = int(config["LOCAL PROPERTIES"].get("TOKEN_SPILL_THRESHOLD", "2000000"))
+        self.checkpoint_dir = config["LOCAL PROPERTIES"].get("CHECKPOINT_DIR", "checkpoint").strip()
+        # In seconds in config.ini, 0 disables checkpoints
+        self.checkpoint_interval = float(config["LOCAL PROPERTIES"].get("CHECKPOINT_INTERVAL", "60"))
+        self.checkpoint_snapshot_every = int(config["LOCAL PROPERTIES"].get("CHECKPOINT_SNAPSHOT_EVERY", "10"))
+        # Fraction of the per-url worker log lines kept, and at most
+        # LOG_RATE_LIMIT of them per second (0 for no limit)
+        self.log_sample_rate = float(config["LOCAL PROPERTIES"].get("LOG_SAMPLE_RATE", "1"))
+        self.log_rate_limit = int(config["LOCAL PROPERTIES"].get("LOG_RATE_LIMIT", "0"))
+        self.log_batch_size = int(config["LOCAL PROPERTIES"].get("LOG_BATCH_SIZE", "100"))
+        # In milliseconds in config.ini
+        self.log_flush_interval = float(config["LOCAL PROPERTIES"].get("LOG_FLUSH_INTERVAL", "1000")) / 1000
+        self.archive_dir = config["LOCAL PROPERTIES"].get("ARCHIVE_DIR", "").strip()
+        # In MiB in config.ini
+        self.archive_segment_size = int(config["LOCAL PROPERTIES"].get("ARCHIVE_SEGMENT_SIZE", "256")) << 20
+        self.page_cache_file = config["LOCAL PROPERTIES"].get("PAGE_CACHE_FILE", "page_cache.pkl").strip()
+        # In MiB in config.ini
+        self.page_cache_size = int(config["LOCAL PROPERTIES"].get("PAGE_CACHE_SIZE", "0")) << 20
+        self.page_cache_conditional = config["LOCAL PROPERTIES"].getboolean("PAGE_CACHE_CONDITIONAL", False)
+        # In seconds in config.ini, 0 only writes the reports when the crawl ends
+        self.report_interval = float(config["LOCAL PROPERTIES"].get("REPORT_INTERVAL", "0"))
+        self.metrics = config["LOCAL PROPERTIES"].getboolean("METRICS", False)
+        # In seconds in config.ini
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICS_INTERVAL", "30"))
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICS_PORT", "0"))
+        self.record_dir = config["LOCAL PROPERTIES"].get("RECORD_DIR", "").strip()
+        self.replay_dir = config["LOCAL PROPERTIES"].get("REPLAY_DIR", "").strip()
+        # In milliseconds in config.ini
+        self.replay_latency = float(config["LOCAL PROPERTIES"].get("REPLAY_LATENCY", "0")) / 1000
+        self.forward_batch_size = int(config["LOCAL PROPERTIES"].get("FORWARD_BATCH_SIZE", "100"))
+        # In milliseconds in config.ini
+        self.forward_interval = float(config["LOCAL PROPERTIES"].get("FORWARD_INTERVAL", "50")) / 1000
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        # A download without an answer within this many seconds fails, and the host backs off
+        self.download_timeout = float(config["CRAWLER"].get("DOWNLOAD_TIMEOUT", "30"))
+        self.rate_floor = float(config["CRAWLER"].get("RATE_FLOOR", str(self.time_delay)))
+        self.rate_ceiling = float(config["CRAWLER"].get("RATE_CEILING", "30"))
+        self.rate_backoff = float(config["CRAWLER"].get("RATE_BACKOFF", "2"))
+        self.rate_speedup = float(config["CRAWLER"].get("RATE_SPEEDUP", "0.9"))
+        self.rate_latency_factor = float(config["CRAWLER"].get("RATE_LATENCY_FACTOR", "1"))
+        self.host_budget = int(config["CRAWLER"].get("HOST_BUDGET", "0"))
+        self.subdomain_budget = int(config["CRAWLER"].get("SUBDOMAIN_BUDGET", "0"))
+        self.engine = config["CRAWLER"].get("ENGINE", "threaded").strip().lower()
 
         self.cache_server = None
\ No newline at end of file
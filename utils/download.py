@@ -2,13 +2,28 @@ import requests
 import cbor
 import time
 
+from threading import local
+
 from utils.response import Response
+from utils.replay import get_recorder
+
+# One keep-alive session per worker thread, requests.Session is not thread safe.
+thread_sessions = local()
+
+def get_session():
+    if not hasattr(thread_sessions, "session"):
+        thread_sessions.session = requests.Session()
+    return thread_sessions.session
 
-def download(url, config, logger=None):
+def download(url, config, logger=None, headers=None):
+    # headers: e.g. the conditional headers of a cached page
     host, port = config.cache_server
-    resp = requests.get(
+    resp = get_session().get(
         f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")], headers=headers,
+        timeout=config.download_timeout)
+    if config.record_dir:
+        get_recorder(config.record_dir).record(url, resp.status_code, resp.content)
     try:
         if resp and resp.content:
             return Response(cbor.loads(resp.content))
@@ -0,0 +1,71 @@
+from lxml import etree
+from bs4.dammit import UnicodeDammit
+
+
+# Text inside these tags is not page text, the same as BeautifulSoup's get_text
+skipped_text_tags = {"script", "style", "template"}
+
+
+class ExtractTarget(object):
+    '''
+    lxml parser target collecting the text strings and <a> hrefs of a page
+    in a single streaming pass, without building a tree. Text split by a
+    tag or a comment becomes separate strings, as it does in BeautifulSoup.
+    '''
+
+    def __init__(self):
+        self.strings = list()
+        self.links = list()
+        self.buffer = list()
+        self.skip_depth = 0
+
+    def _flush(self):
+        if self.buffer:
+            if not self.skip_depth:
+                text = "".join(self.buffer).strip()
+                if text:
+                    self.strings.append(text)
+            self.buffer.clear()
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag in skipped_text_tags:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.links.append(href)
+
+    def end(self, tag):
+        self._flush()
+        if tag in skipped_text_tags:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        self.buffer.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return self.strings, self.links
+
+
+def decode(content):
+    # Most pages are UTF-8. Anything else goes through the same encoding
+    # detection BeautifulSoup uses, so both engines see the same text.
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return UnicodeDammit(content, is_html=True).unicode_markup or ""
+
+
+def extract_text_and_links(content):
+    # Returns the page text joined by single spaces and the list of hrefs.
+    parser = etree.HTMLParser(target=ExtractTarget(), recover=True)
+    parser.feed(decode(content))
+    strings, links = parser.close()
+    return " ".join(strings), links
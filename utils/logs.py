@@ -0,0 +1,202 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import time
+
+from logging.handlers import QueueHandler, QueueListener, MemoryHandler
+from threading import Lock
+
+
+log_dir = "Logs"
+log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class BatchingHandler(MemoryHandler):
+    '''
+    Buffers records for one log file and writes them `capacity` at a time,
+    or once `flush_interval` seconds passed since the last write. Warnings
+    and errors are written right away.
+    '''
+
+    def __init__(self, target, capacity, flush_interval):
+        super().__init__(capacity, flushLevel=logging.WARNING, target=target)
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record) or
+                time.monotonic() - self.last_flush >= self.flush_interval)
+
+    def flush(self):
+        super().flush()
+        self.last_flush = time.monotonic()
+
+
+class FileRouter(logging.Handler):
+    ''' Sends each record to the batched handler of its log file, made on first use. '''
+
+    def __init__(self):
+        super().__init__()
+        self.batch_size = 1
+        self.flush_interval = 0.0
+        self.files = dict()
+
+    def emit(self, record):
+        handler = self.files.get(record.log_file)
+        if handler is None:
+            file_handler = logging.FileHandler(os.path.join(log_dir, f"{record.log_file}.log"))
+            file_handler.setFormatter(logging.Formatter(log_format))
+            handler = self.files[record.log_file] = BatchingHandler(
+                file_handler, self.batch_size, self.flush_interval)
+        handler.handle(record)
+
+    def flush(self):
+        for handler in self.files.values():
+            handler.flush()
+
+    def close(self):
+        for handler in self.files.values():
+            # MemoryHandler.close flushes, then drops its target
+            target = handler.target
+            handler.close()
+            if target is not None:
+                target.close()
+        super().close()
+
+
+class FlushingListener(QueueListener):
+    ''' Also writes out the buffered log files whenever the queue stays empty for `flush_interval`. '''
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=file_router.flush_interval or None)
+            except queue.Empty:
+                file_router.flush()
+
+
+class FileQueueHandler(QueueHandler):
+    '''
+    Puts a logger's records on the shared queue, tagged with its log file.
+    Records are queued as is: formatting happens on the listener thread,
+    so the calling thread only pays for the put.
+    '''
+
+    def __init__(self, log_queue, log_file):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        record.log_file = self.log_file
+        return record
+
+
+class Sampler(object):
+    '''
+    Thins out the per-url INFO lines of the workers: keeps a `sample_rate`
+    fraction of them, then at most `rate_limit` per second (0 for no
+    limit). Warnings and errors always pass.
+    '''
+
+    def __init__(self):
+        self.sample_rate = 1.0
+        self.rate_limit = 0
+        self.lock = Lock()
+        self.window = 0
+        self.window_count = 0
+
+    def configure(self, sample_rate, rate_limit):
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+
+    def keep(self, level):
+        if level >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.rate_limit:
+            with self.lock:
+                window = int(time.monotonic())
+                if window != self.window:
+                    self.window, self.window_count = window, 0
+                if self.window_count >= self.rate_limit:
+                    return False
+                self.window_count += 1
+        return True
+
+
+class SampledLogger(logging.LoggerAdapter):
+    ''' Logger whose INFO lines go through the sampler before a record is even made. '''
+
+    def __init__(self, logger):
+        super().__init__(logger, None)
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level) and sampler.keep(level)
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+
+log_queue = queue.SimpleQueue()
+file_router = FileRouter()
+console_handler = None
+listener = None
+setup_lock = Lock()
+sampler = Sampler()
+
+
+def start_listener():
+    # Must be called with setup_lock held.
+    global console_handler, listener
+    os.makedirs(log_dir, exist_ok=True)
+    file_router.setLevel(logging.DEBUG)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter(log_format))
+    listener = FlushingListener(log_queue, file_router, console_handler, respect_handler_level=True)
+    listener.start()
+
+
+def get_logger(name, filename=None, sampled=False):
+    # The logger of `name`, writing to Logs/<filename or name>.log through
+    # the background listener. Safe to call again for the same name.
+    # sampled: for per-url lines, returns a SampledLogger of the logger.
+    logger = logging.getLogger(name)
+    with setup_lock:
+        if listener is None:
+            start_listener()
+        if not any(isinstance(handler, FileQueueHandler) for handler in logger.handlers):
+            logger.setLevel(logging.INFO)
+            logger.addHandler(FileQueueHandler(log_queue, filename if filename else name))
+    return SampledLogger(logger) if sampled else logger
+
+
+def configure_logging(config):
+    # Applies the LOG_* settings of config.ini to every logger, including
+    # the ones already made.
+    sampler.configure(config.log_sample_rate, config.log_rate_limit)
+    file_router.batch_size = config.log_batch_size
+    file_router.flush_interval = config.log_flush_interval
+    for handler in file_router.files.values():
+        handler.capacity = config.log_batch_size
+        handler.flush_interval = config.log_flush_interval
+
+
+def stop_logging():
+    # Writes out every queued and buffered record. Logging resumes on the
+    # next get_logger call.
+    global listener
+    with setup_lock:
+        if listener is None:
+            return
+        listener.stop()
+        listener = None
+        file_router.flush()
+        console_handler.flush()
+
+
+# Registered after logging's own exit hook, so it runs first
+atexit.register(stop_logging)
@@ -0,0 +1,228 @@
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock, Event
+
+from utils import get_logger
+
+
+# Upper bounds in seconds of the latency histogram buckets, the last one is +Inf
+latency_buckets = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# Only the largest per-host queues are shown in the summary log
+summary_hosts = 5
+
+# Returned by every timer while metrics are disabled, nullcontext is reusable
+disabled_timer = nullcontext()
+
+
+class Histogram(object):
+    ''' Latencies counted in fixed buckets, like a Prometheus histogram. '''
+
+    def __init__(self):
+        self.counts = [0] * len(latency_buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(latency_buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(latency_buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return latency_buckets[-1]
+
+
+class Metrics(object):
+    '''
+    Counters, latency histograms and gauges of the crawl stages.
+
+    Disabled by default: every call returns right away and `timer` hands out
+    a shared no-op context, so instrumented code costs a method call. When
+    enabled, a summary is logged every `interval` seconds and, if a port is
+    set, the metrics are served in the Prometheus text format on localhost.
+
+    Counters take their labels as keyword arguments. Gauges are callables
+    evaluated when the metrics are read, returning a number or a dict of
+    host -> number.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = Lock()
+        self.counters = dict()
+        self.histograms = dict()
+        self.gauges = dict()
+        self.interval = 30
+        self.port = 0
+        self.logger = None
+        self.stopped = Event()
+        self.reporter = None
+        self.server = None
+
+    def configure(self, config):
+        self.enabled = config.metrics
+        self.interval = config.metrics_interval
+        self.port = config.metrics_port
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name):
+        if not self.enabled:
+            return disabled_timer
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name, function):
+        # Wraps a function that is called too often for a with block
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - start)
+        return timed_function
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def read_gauges(self):
+        values = dict()
+        for name, read in list(self.gauges.items()):
+            try:
+                values[name] = read()
+            except Exception:
+                continue
+        return values
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.logger = get_logger("METRICS")
+        if self.interval > 0:
+            self.reporter = Thread(target=self._report_periodically, daemon=True)
+            self.reporter.start()
+        if self.port:
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+            self.server.daemon_threads = True
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.logger.info(f"Final metrics\n{self.summary()}")
+
+    def _report_periodically(self):
+        while not self.stopped.wait(self.interval):
+            self.logger.info(f"Metrics\n{self.summary()}")
+
+    def summary(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = [(name, histogram.count, histogram.sum, histogram.quantile(0.5), histogram.quantile(0.99))
+                          for name, histogram in sorted(self.histograms.items())]
+        lines = list()
+        for name, count, total, median, p99 in histograms:
+            lines.append(
+                f"  {name:<18} n={count:<8} mean={1000 * total / count:8.2f}ms "
+                f"p50<={1000 * median:.2f}ms p99<={1000 * p99:.2f}ms")
+        for (name, labels), value in counters:
+            label_text = ",".join(f"{key}={label}" for key, label in labels)
+            lines.append(f"  {name}{f'[{label_text}]' if labels else ''} = {value}")
+        for name, value in sorted(self.read_gauges().items()):
+            if isinstance(value, dict):
+                largest = sorted(value.items(), key=lambda item: item[1], reverse=True)[:summary_hosts]
+                value = f"{len(value)} entries, largest " + ", ".join(f"{key}={size}" for key, size in largest)
+            lines.append(f"  {name} = {value}")
+        return "\n".join(lines)
+
+    def render_prometheus(self):
+        prefix = "crawler_"
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: (list(h.counts), h.sum, h.count) for name, h in self.histograms.items()}
+        lines = list()
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{prefix}{name}_total"
+            # One TYPE line per counter, its samples are sorted together
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{metric}{f'{{{label_text}}}' if labels else ''} {value}")
+        for name, (counts, total, count) in sorted(histograms.items()):
+            metric = f"{prefix}{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(latency_buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum {total}")
+            lines.append(f"{metric}_count {count}")
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            if isinstance(value, dict):
+                lines.extend(f'{prefix}{name}{{host="{key}"}} {size}' for key, size in sorted(value.items()))
+            else:
+                lines.append(f"{prefix}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not worth a line on stderr
+        pass
+
+
+# Shared by every module of the crawler, configured by launch.py
+metrics = Metrics()
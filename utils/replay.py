@@ -0,0 +1,113 @@
+import os
+import random
+import struct
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qs
+
+from utils import get_urlhash
+
+
+# Each recorded file starts with the cache server's HTTP status
+status_header = struct.Struct("<H")
+
+
+class ResponseCorpus(object):
+    '''
+    Cache server responses saved on disk, one file per url, holding the HTTP
+    status and the raw body (the CBOR payload) exactly as received. Files
+    are grouped in subdirectories by the first byte of the url fingerprint.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url):
+        name = f"{get_urlhash(url):016x}"
+        return os.path.join(self.directory, name[:2], f"{name}.cbor")
+
+    def record(self, url, status, body):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so a replay never reads half a file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(status_header.pack(status))
+            f.write(body or b"")
+        os.replace(temp_path, path)
+
+    def load(self, url):
+        # (status, body) of the recorded response, or None
+        try:
+            with open(self._path(url), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return status_header.unpack_from(data)[0], data[status_header.size:]
+
+    def __len__(self):
+        return sum(
+            len([name for name in names if name.endswith(".cbor")])
+            for _, _, names in os.walk(self.directory))
+
+
+recorders = dict()
+recorders_lock = Lock()
+
+
+def get_recorder(directory):
+    # One corpus per directory, shared by the download threads
+    with recorders_lock:
+        if directory not in recorders:
+            recorders[directory] = ResponseCorpus(directory)
+        return recorders[directory]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        recorded = server.corpus.load(url)
+        status, body = recorded if recorded else (404, b"")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(object):
+    '''
+    Local stand-in for the cache server that serves a ResponseCorpus. Every
+    request waits `latency` plus up to `jitter` seconds, so a crawl can be
+    measured offline under a chosen network delay. Urls missing from the
+    corpus get an empty 404, which the crawler treats as a failed download.
+    '''
+
+    def __init__(self, corpus, latency=0.0, jitter=0.0, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), ReplayHandler)
+        self.server.daemon_threads = True
+        self.server.corpus = corpus
+        self.server.latency = latency
+        self.server.jitter = jitter
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,14 +1,147 @@
+import io
 import pickle
 
+from _compat_pickle import IMPORT_MAPPING, NAME_MAPPING
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from utils import get_logger
+
+
+class PickledObject(object):
+    ''' Stand-in for the requests classes in a pickled response, it only keeps their state. '''
+
+    __slots__ = ("state",)
+
+    def __init__(self, *args, **kwargs):
+        self.state = None
+
+    def __setstate__(self, state):
+        self.state = state
+
+
+# Globals a pickled requests.Response may refer to. Plain data types are
+# rebuilt as is, the requests and cookie classes become PickledObjects, and
+# anything else stops the unpickling, so a payload can not run code.
+safe_globals = {
+    ("collections", "OrderedDict"): dict,
+    ("builtins", "dict"): dict,
+    ("builtins", "list"): list,
+    ("builtins", "set"): set,
+    ("builtins", "frozenset"): frozenset,
+    ("builtins", "object"): object,
+    ("datetime", "timedelta"): timedelta,
+    ("datetime", "datetime"): datetime,
+}
+stand_in_globals = {
+    ("requests.models", "Response"),
+    ("requests.models", "PreparedRequest"),
+    ("requests.structures", "CaseInsensitiveDict"),
+    ("requests.cookies", "RequestsCookieJar"),
+    ("http.cookiejar", "DefaultCookiePolicy"),
+    ("http.cookiejar", "Cookie"),
+    ("urllib3._collections", "HTTPHeaderDict"),
+}
+
+
+def encode_latin1(text, encoding):
+    # Safe _codecs.encode: protocol 2 pickles bytes as encode(<str>, "latin1")
+    if encoding not in ("latin1", "latin-1"):
+        raise pickle.UnpicklingError(f"Refusing to encode with {encoding}")
+    return text.encode("latin1")
+
+
+def reconstruct(cls, base, state):
+    # Safe copyreg._reconstructor: only builds stand-ins and plain objects
+    if cls is not PickledObject or base not in (object, dict):
+        raise pickle.UnpicklingError(f"Refusing to reconstruct {cls}")
+    return PickledObject()
+
+
+class ResponseUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # Protocols 0 to 2 write Python 2 names (copy_reg, cookielib, ...),
+        # mapped as pickle.Unpickler does before they are checked
+        if (module, name) in NAME_MAPPING:
+            module, name = NAME_MAPPING[(module, name)]
+        elif module in IMPORT_MAPPING:
+            module = IMPORT_MAPPING[module]
+        if (module, name) in safe_globals:
+            return safe_globals[(module, name)]
+        if (module, name) in stand_in_globals:
+            return PickledObject
+        if (module, name) == ("copyreg", "_reconstructor"):
+            return reconstruct
+        if (module, name) == ("_codecs", "encode"):
+            return encode_latin1
+        raise pickle.UnpicklingError(f"Refusing to unpickle {module}.{name}")
+
+
+def unpickle_response(data):
+    # (url, content, headers) of a pickled requests.Response, headers with lowercase names
+    response = ResponseUnpickler(io.BytesIO(data)).load()
+    if not isinstance(response, PickledObject) or not isinstance(response.state, dict):
+        raise pickle.UnpicklingError("Not a pickled response")
+    state = response.state
+    headers = dict()
+    stored_headers = state.get("headers")
+    if isinstance(stored_headers, PickledObject) and isinstance(stored_headers.state, dict):
+        for key, value in stored_headers.state.get("_store", dict()).values():
+            headers[key.lower()] = value
+    return state.get("url"), state.get("_content"), headers
+
+
+# What scraper code used to get from the unpickled requests.Response
+RawResponse = namedtuple("RawResponse", ["url", "content", "headers"])
+
+
 class Response(object):
+    '''
+    One page from the cache server. The pickled body is only decoded the
+    first time `content`, `headers` or `raw_response` is read, so pages
+    dropped on their status are never unpickled. Decoding goes through
+    ResponseUnpickler, which rebuilds only the fields the crawler reads.
+    '''
+
+    __slots__ = ("url", "status", "error", "_payload", "_decoded", "_final_url", "_content", "_headers")
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
+        self._payload = resp_dict["response"] if "response" in resp_dict else None
+        self._decoded = False
+        self._final_url = None
+        self._content = None
+        self._headers = None
+
+    def _decode(self):
+        self._decoded = True
+        payload, self._payload = self._payload, None
+        if not isinstance(payload, (bytes, bytearray, memoryview)):
+            return
         try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+            self._final_url, self._content, self._headers = unpickle_response(payload)
+        except (pickle.UnpicklingError, EOFError, TypeError, ValueError, AttributeError, IndexError, KeyError) as e:
+            # The page is then rejected as empty, say why
+            get_logger("RESPONSE").error(f"Could not decode the response of {self.url}: {e}")
+            self._content = None
+
+    @property
+    def content(self):
+        if not self._decoded:
+            self._decode()
+        return self._content
+
+    @property
+    def headers(self):
+        if not self._decoded:
+            self._decode()
+        return self._headers or dict()
+
+    @property
+    def raw_response(self):
+        if self.content is None:
+            return None
+        return RawResponse(self._final_url or self.url, self._content, self._headers or dict())
@@ -0,0 +1,60 @@
+import re
+
+from collections import Counter
+from threading import Lock
+
+
+digits_re = re.compile(r"\d+")
+
+
+class TrapDetector(object):
+    '''
+    Crawler traps learned online from the urls the crawler accepts.
+
+    Every url is reduced to a template: its host, its path with digit runs
+    collapsed to "#" and long letter-digit tokens (session ids, hashes) to
+    "*", and its sorted query keys without values. Calendars, pagination
+    and session ids all produce endless urls of a few templates, so each
+    template is capped at `template_cap` urls. Paths deeper than
+    `max_depth` segments, or repeating one segment more than `max_repeats`
+    times, are rejected outright. A decision only looks at the url itself
+    and one dict entry, so it is O(1) in the size of the crawl.
+    '''
+
+    def __init__(self, template_cap=200, max_depth=10, max_repeats=2, token_length=16):
+        self.template_cap = template_cap
+        self.max_depth = max_depth
+        self.max_repeats = max_repeats
+        self.token_length = token_length
+        self.lock = Lock()
+        # template -> urls accepted
+        self.counts = dict()
+
+    def segment_template(self, segment):
+        if (len(segment) >= self.token_length and
+                any(c.isdigit() for c in segment) and any(c.isalpha() for c in segment)):
+            return "*"
+        return digits_re.sub("#", segment)
+
+    def template(self, parsed, segments=None):
+        if segments is None:
+            segments = [segment for segment in parsed.path.split("/") if segment]
+        path = "/".join(map(self.segment_template, segments))
+        keys = sorted({pair.split("=", 1)[0] for pair in parsed.query.split("&") if pair})
+        return f"{parsed.netloc.lower()}/{path}?{'&'.join(keys)}"
+
+    def rejection_reason(self, parsed):
+        # Why the url looks like a trap, or None. A url that passes is
+        # counted towards its template, so call this once per new url.
+        segments = [segment for segment in parsed.path.split("/") if segment]
+        if len(segments) > self.max_depth:
+            return "depth"
+        if len(segments) > len(set(segments)) and max(Counter(segments).values()) > self.max_repeats:
+            return "repeat"
+        template = self.template(parsed, segments)
+        with self.lock:
+            count = self.counts.get(template, 0)
+            if count >= self.template_cap:
+                return "template"
+            self.counts[template] = count + 1
+        return None
@@ -0,0 +1,94 @@
+from hashlib import blake2b
+from urllib.parse import urljoin, urlsplit, urlunsplit, quote_plus, unquote_plus
+
+
+default_ports = {"http": 80, "https": 443}
+
+# Query parameters that only track where a visitor came from
+tracking_params = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_hsenc", "_hsmi"}
+tracking_param_prefixes = ("utm_",)
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in tracking_params or name.startswith(tracking_param_prefixes)
+
+
+def remove_dot_segments(path):
+    # "." and ".." segments resolved as in RFC 3986 section 5.2.4, which
+    # urljoin only does when given a base
+    if "." not in path:
+        return path
+    absolute = path.startswith("/")
+    segments = path.split("/")
+    output = list()
+    for segment in segments:
+        if segment == "..":
+            if len(output) > (1 if absolute else 0):
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+    if segments[-1] in (".", ".."):
+        # A path ending in a dot segment names a directory
+        output.append("")
+    return "/".join(output)
+
+
+def canonical_query(query):
+    # Tracking parameters removed, the others re-encoded and sorted. A
+    # parameter keeps its blank value and whether it had an "=", so
+    # "?page" and "?page=" stay different urls.
+    params = list()
+    for pair in query.split("&"):
+        if not pair:
+            continue
+        name, equals, value = pair.partition("=")
+        name, value = unquote_plus(name), unquote_plus(value)
+        if is_tracking_param(name):
+            continue
+        params.append((name, equals, value))
+    params.sort()
+    return "&".join(f"{quote_plus(name)}{equals}{quote_plus(value)}" for name, equals, value in params)
+
+
+def canonicalize(url, base=None):
+    '''
+    Canonical spelling of a url, so the same page is only fetched once:
+    resolved against `base`, scheme and host lowercased, default port
+    dropped, dot segments removed, an empty path written as "/", tracking
+    query parameters removed and the others sorted, and fragment removed.
+    A trailing slash is kept: relative links on the page are resolved
+    against it. Raises ValueError for urls that can not be parsed.
+    '''
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    netloc = parts.netloc
+    if parts.hostname is not None:
+        netloc = parts.hostname
+        if ":" in netloc:
+            # IPv6 literal
+            netloc = f"[{netloc}]"
+        port = parts.port
+        if port is not None and port != default_ports.get(scheme):
+            netloc = f"{netloc}:{port}"
+        if parts.username is not None:
+            userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+            netloc = f"{userinfo}@{netloc}"
+
+    query = canonical_query(parts.query) if parts.query else ""
+
+    path = remove_dot_segments(parts.path)
+    if not path and netloc:
+        path = "/"
+
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def url_fingerprint(url):
+    # 64-bit fingerprint of everything other than the scheme of a canonical url.
+    _, _, rest = url.partition("://")
+    return int.from_bytes(blake2b((rest or url).encode("utf-8"), digest_size=8).digest(), "big")
@@ -0,0 +1,54 @@
+import re
+
+
+class UrlFilter(object):
+    '''
+    Static url rules compiled once: allowed domains matched by host suffix,
+    all trap substrings in one alternation regex, trap query parameters and
+    invalid extensions in sets. Trap parameters are matched by name, so
+    they are found wherever canonicalize sorted them in the query.
+    `rejection_reason` returns why a url is rejected, or None.
+    '''
+
+    def __init__(self, allowed_domains, specific_domain, specific_path,
+                 trap_substrings, invalid_extensions, trap_params=()):
+        self.allowed_domains = frozenset(domain.lower() for domain in allowed_domains)
+        self.specific_domain = specific_domain
+        self.specific_path = specific_path
+        # Longest first, so a trap is never shadowed by one of its prefixes
+        self.trap_re = re.compile("|".join(
+            re.escape(trap) for trap in sorted(trap_substrings, key=len, reverse=True)))
+        self.trap_params = frozenset(trap_params)
+        self.invalid_extensions = frozenset(extension.lower() for extension in invalid_extensions)
+
+    def domain_allowed(self, netloc):
+        # Same as netloc == domain or netloc.endswith("." + domain) for any
+        # allowed domain, with one set lookup per label of the host.
+        if netloc in self.allowed_domains:
+            return True
+        dot = netloc.find(".")
+        while dot != -1:
+            if netloc[dot + 1:] in self.allowed_domains:
+                return True
+            dot = netloc.find(".", dot + 1)
+        return False
+
+    def has_invalid_extension(self, path):
+        parts = path.rsplit(".", 1)
+        return len(parts) == 2 and parts[1].lower() in self.invalid_extensions
+
+    def has_trap_param(self, query):
+        return bool(self.trap_params and query) and any(
+            pair.partition("=")[0] in self.trap_params for pair in query.split("&"))
+
+    def rejection_reason(self, url, parsed):
+        if parsed.scheme not in {"http", "https"}:
+            return "scheme"
+        if (not self.domain_allowed(parsed.netloc) and
+                not (parsed.netloc == self.specific_domain or parsed.path.startswith(self.specific_path))):
+            return "domain"
+        if self.trap_re.search(url) or self.has_trap_param(parsed.query):
+            return "trap"
+        if self.has_invalid_extension(parsed.path):
+            return "extension"
+        return None